@@ -0,0 +1,264 @@
+import os, json, time, queue, threading, datetime
+from DriveLoader.Gdrive_Downloader import Gdrive_Bulker
+from DriveLoader.Gdrive_Uploader import GdriveUploader, RemoteFolderCache
+from DriveLoader.Download_Manifest import DownloadManifest
+from DriveLoader.Transfer_Scheduler import TransferScheduler
+from DriveLoader.Client_Credentials import ACCOUNT_USAGE_FILE
+from DriveLoader.Transfer_Metrics import metrics
+from functions import sanitizer_names
+
+GB = 1024 ** 3
+# Drive's per-user daily transfer limits; 0 = no cap
+DEFAULT_UPLOAD_CAP = 750 * GB
+DEFAULT_DOWNLOAD_CAP = 0
+
+class AccountUsage:
+    """Bytes moved per account today, kept on disk so caps hold across runs.
+
+    Written every `save_every` files or `save_interval` seconds, whichever comes
+    first, and by flush() at the end of a run.
+    """
+    def __init__(self, file_path=ACCOUNT_USAGE_FILE, save_every=100, save_interval=30):
+        self.file_path = file_path
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.data = {}
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+        if os.path.exists(file_path):
+            try:
+                with open(file_path, 'r') as json_file:
+                    self.data = json.load(json_file)
+            except ValueError:
+                print(f"{file_path} is damaged, starting with empty account usage.")
+
+    def _today(self, email):
+        today = datetime.date.today().isoformat()
+        entry = self.data.get(email)
+        if not entry or entry.get('date') != today:
+            entry = self.data[email] = {'date': today, 'download': 0, 'upload': 0}
+        return entry
+
+    def used(self, email, direction):
+        with self.lock:
+            return self._today(email)[direction]
+
+    def add(self, email, direction, amount):
+        with self.lock:
+            self._today(email)[direction] += amount
+            self.unsaved += 1
+            if self.unsaved >= self.save_every or time.monotonic() - self.last_save >= self.save_interval:
+                self.save()
+
+    def flush(self):
+        with self.lock:
+            if self.unsaved:
+                self.save()
+
+    def save(self):
+        """Write the file; callers hold the lock."""
+        os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as json_file:
+            json.dump(self.data, json_file, indent=4)
+        os.replace(temp_path, self.file_path)
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+
+class AccountShard:
+    """One authorized account with its own session, concurrency controller and daily caps."""
+    def __init__(self, credentials, usage, download_cap=DEFAULT_DOWNLOAD_CAP, upload_cap=DEFAULT_UPLOAD_CAP, worker_count=3):
+        self.credentials = credentials
+        self.email = credentials.email or 'token'
+        self.usage = usage
+        self.caps = {'download': download_cap, 'upload': upload_cap}
+        self.worker_count = worker_count
+        # each client gets the account's own pooled session, AIMD controller and retry policy
+        self.downloader = Gdrive_Bulker(credentials)
+        self.downloader.max_downloader_count = worker_count
+        self.uploader = GdriveUploader(credentials)
+        self.uploader.max_uploader_count = worker_count
+        self.throttled_until = 0.0
+        self.completed = 0
+        self.failed = 0
+
+    def controller(self, direction):
+        return self.downloader.download_slots if direction == 'download' else self.uploader.upload_slots
+
+    def can_take(self, direction, size):
+        cap = self.caps[direction]
+        return not cap or self.usage.used(self.email, direction) + size <= cap
+
+    @property
+    def throttled(self):
+        return time.monotonic() < self.throttled_until
+
+class ShardItem:
+    """A queued transfer plus the accounts that already failed it."""
+    def __init__(self, direction, size, args, label):
+        self.direction = direction
+        self.size = size
+        self.args = args
+        self.label = label
+        self.tried = set()
+
+class ShardedTransfer:
+    """Spread one bulk download or upload over several accounts.
+
+    Every account runs its own workers against one shared queue, so a fast
+    account simply takes more items. An item that fails on one account (quota
+    error, throttling, ...) goes back on the queue for the others; an account
+    whose requests were just throttled stops taking work for a while, and an
+    account that reached its daily cap leaves the rest to the others.
+    """
+    def __init__(self, credentials_list, download_cap=DEFAULT_DOWNLOAD_CAP, upload_cap=DEFAULT_UPLOAD_CAP,
+                 workers_per_account=3, throttle_pause=60):
+        if not credentials_list:
+            raise ValueError("At least one account is needed for a sharded transfer.")
+        self.usage = AccountUsage()
+        self.shards = [AccountShard(credentials, self.usage, download_cap, upload_cap, workers_per_account)
+                       for credentials in credentials_list]
+        self.throttle_pause = throttle_pause
+        self.work = queue.Queue()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0
+        self.failed = 0
+
+    def submit(self, func, drive_file, folder_path, manifest):
+        """TransferScheduler-compatible entry point for Gdrive_Bulker.queue_folder (which counts it as queued)."""
+        self._put(ShardItem('download', drive_file.size or 0, (drive_file, folder_path, manifest), drive_file.name))
+
+    def _put(self, item):
+        with self.lock:
+            self.pending += 1
+        self.work.put(item)
+
+    def _done(self, failed=False):
+        metrics.file_finished(not failed)
+        with self.lock:
+            self.pending -= 1
+            self.failed += failed
+            if self.pending == 0:
+                self.idle.notify_all()
+
+    def _others(self, shard, item):
+        """Accounts other than `shard` that may still take `item`."""
+        return [other for other in self.shards if other is not shard
+                and other.email not in item.tried and other.can_take(item.direction, item.size)]
+
+    def _run_item(self, shard, item):
+        if item.direction == 'download':
+            drive_file, folder_path, manifest = item.args
+            try:
+                ok = shard.downloader.file_downloader(drive_file, folder_path)
+            except Exception as e:
+                # e.g. disk full; the worker must live on to report the item done
+                print(f"[{shard.email}] Error downloading {drive_file.name}: {e}")
+                return None
+            if ok:
+                manifest.mark(drive_file, os.path.join(folder_path, sanitizer_names(drive_file.name)))
+                return item.size
+            return None
+        file_path, folder_id = item.args
+        try:
+            uploaded = shard.uploader.upload_file(file_path, folder_id)
+        except Exception as e:
+            print(f"[{shard.email}] Error uploading {file_path}: {e}")
+            return None
+        return item.size if uploaded else 0
+
+    def _worker(self, shard):
+        while True:
+            item = self.work.get()
+            if item is None:
+                break
+            usable = shard.email not in item.tried and shard.can_take(item.direction, item.size)
+            if not usable or shard.throttled:
+                if self._others(shard, item):
+                    # leave it to an account that can still take it
+                    self.work.put(item)
+                    time.sleep(0.05)
+                    continue
+                if not usable:
+                    print(f"No account left that can transfer {item.label}")
+                    self._done(failed=True)
+                    continue
+                # only this account is left, wait out its pause
+                time.sleep(max(0.0, shard.throttled_until - time.monotonic()))
+
+            controller = shard.controller(item.direction)
+            throttles = controller.last_decrease
+            moved = self._run_item(shard, item)
+            if moved is not None:
+                shard.completed += 1
+                if moved:
+                    self.usage.add(shard.email, item.direction, moved)
+                self._done()
+                continue
+
+            shard.failed += 1
+            item.tried.add(shard.email)
+            if controller.last_decrease != throttles:
+                shard.throttled_until = time.monotonic() + self.throttle_pause
+                print(f"[{shard.email}] throttled, pausing it for {self.throttle_pause}s")
+            if self._others(shard, item):
+                # another account steals the item
+                self.work.put(item)
+            else:
+                self._done(failed=True)
+
+    def _start(self, direction):
+        workers = []
+        for shard in self.shards:
+            shard.controller(direction).set_maximum(shard.worker_count)
+            for index in range(shard.worker_count):
+                worker = threading.Thread(target=self._worker, args=(shard,), name=f'{shard.email}-{index}', daemon=True)
+                worker.start()
+                workers.append(worker)
+        return workers
+
+    def _finish(self, workers):
+        with self.lock:
+            while self.pending:
+                self.idle.wait()
+        for _ in workers:
+            self.work.put(None)
+        for worker in workers:
+            worker.join()
+        self.usage.flush()
+        for shard in self.shards:
+            print(f"[{shard.email}] {shard.completed} done, {shard.failed} failed attempts, "
+                  f"{self.usage.used(shard.email, 'download') / GB:.2f} GB down / {self.usage.used(shard.email, 'upload') / GB:.2f} GB up today")
+
+    def download_folder(self, folder_id, folder_path):
+        """Download a folder tree, listing with the first account and transferring with all of them."""
+        lister = self.shards[0].downloader
+        workers = self._start('download')
+        with DownloadManifest(folder_path) as manifest, \
+                TransferScheduler(lister.max_lister_count, queue_size=0, name='listing') as listings:
+            listings.submit(lister.queue_folder, folder_id, folder_path, listings, self, manifest)
+            listings.join()
+            self._finish(workers)
+        print(f"Sharded download finished, {self.failed} files failed.")
+
+    def upload_folder(self, folder_path, parent_folder_id='root'):
+        """Upload a folder tree; the target must be writable by every account (e.g. a shared folder)."""
+        folder_path = os.path.normpath(folder_path)
+        folder_id, folder_map = self.shards[0].uploader.prepare_remote_tree(folder_path, parent_folder_id)
+        for shard in self.shards:
+            shard.uploader.folder_cache = RemoteFolderCache(shard.uploader)
+
+        workers = self._start('upload')
+        for root, dirs, files in os.walk(folder_path):
+            parent_id = folder_map.get(root, folder_id)
+            for file_name in files:
+                file_path = os.path.join(root, file_name)
+                metrics.file_queued()
+                self._put(ShardItem('upload', os.path.getsize(file_path), (file_path, parent_id), file_path))
+        self._finish(workers)
+
+        for shard in self.shards:
+            shard.uploader.folder_cache = None
+        print(f"Sharded upload of {os.path.basename(folder_path)} finished, {self.failed} files failed.")
@@ -0,0 +1,276 @@
+import os, time, asyncio
+from tqdm import tqdm
+from functions import sanitizer_names
+from DriveLoader.Drive_Records import DriveFile, FILE_FIELDS
+from DriveLoader.Download_Manifest import DownloadManifest, prepare_part, part_verified, discard_part
+from DriveLoader.Rate_Limiter import download_limiter
+from DriveLoader.Retry_Policy import RetryPolicy, AimdController, classify_status
+from DriveLoader.Transfer_Metrics import metrics, endpoint_name
+
+try:
+    import aiohttp
+except ImportError:  # optional, only needed for the asyncio engine
+    aiohttp = None
+
+class DriveResponseError(Exception):
+    """Error status of an aiohttp response, with the parsed error body for classify_status."""
+    def __init__(self, response, error_json):
+        super().__init__(f"HTTP {response.status} for {response.url}")
+        self.response = response
+        self.status = response.status
+        self.error_json = error_json
+
+class AsyncDriveEngine:
+    """asyncio download engine for jobs with a very high file count.
+
+    Runs behind Gdrive_Bulker.download_folder / download_single_file when
+    `engine == 'asyncio'`. Hundreds of transfers share one event loop and one
+    aiohttp connection pool instead of one thread each; a bounded file queue
+    provides backpressure so listing never runs far ahead of downloading.
+    Errors follow the threaded engine's rules: fatal statuses fail at once,
+    throttling honours Retry-After and shrinks the number of active downloaders.
+    """
+    def __init__(self, bulker, max_retries=5):
+        if aiohttp is None:
+            raise ImportError("The asyncio engine needs aiohttp: pip install aiohttp")
+        self.bulker = bulker  # source of token, paths and limits
+        self.max_retries = max_retries
+        self.chunk_size = 256 * 1024
+        # downloaders numbered at or above slots.limit sit out while Drive is throttling us
+        self.slots = AimdController(bulker.max_async_count)
+        self.retry_policy = RetryPolicy(max_retries=max_retries, controller=self.slots)
+
+    def download_folder(self, folder_id, folder_path):
+        return asyncio.run(self._download_folder(folder_id, folder_path))
+
+    def download_single_file(self, file_id, folder_path):
+        asyncio.run(self._download_single_file(file_id, folder_path))
+
+    def _client(self):
+        limit = self.bulker.max_async_count
+        connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit)
+        timeout = aiohttp.ClientTimeout(sock_connect=10, sock_read=60)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def _headers(self):
+        """Auth headers; a due token refresh is a blocking HTTP call, so it runs off the loop."""
+        credentials = self.bulker.credentials
+        if credentials.valid:
+            return credentials.headers()
+        return await asyncio.to_thread(self.bulker.get_headers)
+
+    async def _check(self, response):
+        """raise_for_status that keeps the error body, which tells quota 403s from permission ones."""
+        if response.status < 400:
+            return
+        try:
+            error_json = await response.json(content_type=None)
+        except (ValueError, aiohttp.ClientError):
+            error_json = None
+        raise DriveResponseError(response, error_json)
+
+    async def _retry(self, error, attempt, headers, refreshed):
+        """RetryPolicy.backoff for the event loop; returns (worth retrying, refreshed).
+
+        A 401 refreshes the token (off the loop) and resends at once, one time per call."""
+        if isinstance(error, DriveResponseError) and error.status == 401:
+            credentials = self.bulker.credentials
+            if refreshed or not credentials.refresh_token:
+                return False, refreshed
+            stale_token = headers.get('Authorization', '')[len('Bearer '):]
+            await asyncio.to_thread(credentials.refresh, stale_token)
+            return True, True
+
+        if isinstance(error, DriveResponseError):
+            kind, response = classify_status(error.status, error.error_json), error.response
+        else:
+            kind, response = 'network', None  # connection errors, cut streams, timeouts
+        if kind == 'fatal':
+            return False, refreshed
+        metrics.retry(kind)
+        if kind == 'rate_limit':
+            self.slots.on_throttle()
+        await asyncio.sleep(self.retry_policy.delay(attempt, response))
+        return True, refreshed
+
+    async def _get_json(self, session, url, params=None):
+        """GET a metadata or listing URL with the engine's retry rules."""
+        refreshed = False
+        for attempt in range(self.max_retries + 1):
+            headers = await self._headers()
+            try:
+                request_time = time.monotonic()
+                async with session.get(url, headers=headers, params=params) as response:
+                    metrics.api_call(endpoint_name('GET', url), time.monotonic() - request_time, response.status)
+                    await self._check(response)
+                    result = await response.json()
+                self.slots.on_success()
+                return result
+            except (aiohttp.ClientError, asyncio.TimeoutError, DriveResponseError) as e:
+                retry, refreshed = await self._retry(e, attempt, headers, refreshed)
+                if not retry or attempt == self.max_retries:
+                    raise
+
+    async def _download_single_file(self, file_id, folder_path):
+        async with self._client() as session:
+            url = f'{self.bulker.base_url}/files/{file_id}'
+            drive_file = DriveFile.from_json(await self._get_json(session, url, {'fields': FILE_FIELDS}))
+            with tqdm(total=drive_file.size or 0, unit="B", unit_scale=True, desc=drive_file.name) as pbar:
+                await self._fetch(session, drive_file, folder_path, pbar)
+
+    async def _download_folder(self, folder_id, folder_path):
+        concurrency = self.bulker.max_async_count
+        folders = asyncio.Queue()
+        files = asyncio.Queue(maxsize=concurrency * 4)  # backpressure for the listers
+        stats = {'done': 0, 'failed': 0, 'folders_failed': 0}
+
+        async with self._client() as session:
+            with DownloadManifest(folder_path) as manifest, tqdm(total=0, unit="B", unit_scale=True, desc="asyncio download") as pbar:
+                await folders.put((folder_id, folder_path))
+                listers = [asyncio.create_task(self._lister(session, folders, files, pbar, stats, manifest))
+                           for _ in range(self.bulker.max_lister_count)]
+                downloaders = [asyncio.create_task(self._downloader(index, session, files, pbar, stats, manifest))
+                               for index in range(concurrency)]
+
+                await folders.join()
+                await files.join()
+                for task in listers + downloaders:
+                    task.cancel()
+                results = await asyncio.gather(*listers, *downloaders, return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"\nasyncio worker stopped by an error: {result!r}")
+
+        print(f"\nasyncio engine finished: {stats['done']} files downloaded, {stats['failed']} failed"
+              f"{', ' + str(stats['folders_failed']) + ' folders could not be listed' if stats['folders_failed'] else ''}.")
+        return not stats['failed'] and not stats['folders_failed']
+
+    async def _lister(self, session, folders, files, pbar, stats, manifest):
+        while True:
+            folder_id, folder_path = await folders.get()
+            try:
+                await asyncio.to_thread(os.makedirs, folder_path, exist_ok=True)
+                await asyncio.to_thread(manifest.mark_folder, folder_id, folder_path)
+                page_token = None
+                while True:
+                    params = {
+                        'q': f"'{folder_id}' in parents and trashed=false",
+                        'spaces': 'drive',
+                        'fields': f'nextPageToken, files({FILE_FIELDS})',
+                        'pageSize': self.bulker.page_size,
+                    }
+                    if page_token:
+                        params['pageToken'] = page_token
+                    # a page is retried like any other call, only a page that keeps failing loses the folder
+                    listing = await self._get_json(session, f'{self.bulker.base_url}/files', params)
+
+                    drive_files = [DriveFile.from_json(file) for file in listing.get('files', [])]
+                    known = await asyncio.to_thread(manifest.lookup_many, [drive_file.id for drive_file in drive_files])
+                    for drive_file in drive_files:
+                        if drive_file.google_native:
+                            continue  # Docs, Sheets, shortcuts... have no bytes to download
+                        if drive_file.mime_type == self.bulker.folder_mime_type:
+                            await folders.put((drive_file.id, os.path.join(folder_path, sanitizer_names(drive_file.name))))
+                        elif manifest.is_complete(drive_file, os.path.join(folder_path, sanitizer_names(drive_file.name)), known.get(drive_file.id)):
+                            continue
+                        else:
+                            pbar.total += drive_file.size or 0
+                            pbar.refresh()
+                            metrics.file_queued()
+                            await files.put((drive_file, folder_path))
+
+                    page_token = listing.get('nextPageToken')
+                    if not page_token:
+                        break
+            except Exception as e:
+                # any error ends only this folder, the lister goes on with the next one
+                print(f"\nError listing folder {folder_id}: {e!r}")
+                stats['folders_failed'] += 1
+            finally:
+                folders.task_done()
+
+    async def _downloader(self, index, session, files, pbar, stats, manifest):
+        while True:
+            while index >= self.slots.limit:
+                await asyncio.sleep(0.1)  # throttled: fewer downloaders take new files
+            drive_file, folder_path = await files.get()
+            try:
+                if await self._fetch(session, drive_file, folder_path, pbar):
+                    manifest.mark(drive_file, os.path.join(folder_path, sanitizer_names(drive_file.name)))
+                    stats['done'] += 1
+                    metrics.file_finished(True)
+                else:
+                    stats['failed'] += 1
+                    metrics.file_finished(False)
+            except Exception as e:
+                # e.g. disk full or a malformed response; keep the worker alive for the next file
+                print(f"\nError downloading {drive_file.name}: {e!r}")
+                stats['failed'] += 1
+                metrics.file_finished(False)
+            finally:
+                files.task_done()
+
+    async def _fetch(self, session, drive_file, folder_path, pbar):
+        """Download one file into a .part sidecar (resuming it if present) and rename it into place."""
+        file_path = os.path.join(folder_path, sanitizer_names(drive_file.name))
+        part_path = file_path + '.part'
+        total_size = drive_file.size or 0
+
+        if os.path.exists(file_path) and os.path.getsize(file_path) == total_size:
+            pbar.update(total_size)
+            return True
+        await asyncio.to_thread(prepare_part, drive_file, part_path)
+
+        refreshed = False
+        for attempt in range(self.max_retries):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if total_size and offset > total_size:
+                offset = 0
+            headers = await self._headers()
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+            try:
+                if not (total_size and offset == total_size):
+                    url = f'{self.bulker.base_url}/files/{drive_file.id}?alt=media'
+                    request_time = time.monotonic()
+                    async with session.get(url, headers=headers) as response:
+                        metrics.api_call(endpoint_name('GET', url), time.monotonic() - request_time, response.status)
+                        await self._check(response)
+                        if offset and response.status != 206:
+                            offset = 0
+                        out_file = await asyncio.to_thread(open, part_path, 'ab' if offset else 'wb')
+                        try:
+                            async for chunk in response.content.iter_chunked(self.chunk_size):
+                                if request_time is not None:
+                                    metrics.first_byte(time.monotonic() - request_time)
+                                    request_time = None
+                                metrics.add_bytes('download', len(chunk))
+                                # file writes run off the event loop
+                                await asyncio.to_thread(out_file.write, chunk)
+                                pbar.update(len(chunk))
+                                wait = download_limiter.reserve(len(chunk))
+                                if wait:
+                                    await asyncio.sleep(wait)
+                        finally:
+                            await asyncio.to_thread(out_file.close)
+
+                if total_size and os.path.getsize(part_path) != total_size:
+                    continue
+                if not await asyncio.to_thread(part_verified, drive_file, part_path):
+                    print(f"\nChecksum mismatch for {drive_file.name}. Downloading it again... ({attempt + 1}/{self.max_retries})")
+                    await asyncio.to_thread(os.remove, part_path)
+                    continue
+                await asyncio.to_thread(os.replace, part_path, file_path)
+                await asyncio.to_thread(os.remove, part_path + '.meta')
+                self.slots.on_success()
+                return True
+            except (aiohttp.ClientError, asyncio.TimeoutError, DriveResponseError) as e:
+                print(f"\nError occurred while downloading {drive_file.name}: {e}. ({attempt + 1}/{self.max_retries})")
+                retry, refreshed = await self._retry(e, attempt, headers, refreshed)
+                if not retry:
+                    print(f"Not retrying {drive_file.name}: {e}")
+                    await asyncio.to_thread(discard_part, part_path)
+                    return False
+
+        print(f"Failed to download {drive_file.name} after {self.max_retries} attempts.")
+        return False
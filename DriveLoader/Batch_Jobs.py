@@ -0,0 +1,129 @@
+import os, json
+from functions import link_to_id, sanitizer_names
+from DriveLoader.Drive_Batch import DriveBatch
+from DriveLoader.Drive_Records import DriveFile, FILE_FIELDS
+from DriveLoader.Download_Manifest import DownloadManifest
+from DriveLoader.Transfer_Scheduler import TransferScheduler
+from DriveLoader.Transfer_Metrics import metrics
+
+class JobEntry:
+    """One link of a job file with its destination and options."""
+    def __init__(self, file_id, link, destination, segmented=False):
+        self.file_id = file_id
+        self.link = link
+        self.destination = destination
+        self.segmented = segmented
+        self.drive_file = None  # filled in by BatchJob.resolve
+
+def read_job_file(file_path, default_destination):
+    """Parse a job file: one link per line, or JSONL objects like
+    {"link": "...", "dest": "Downloads/x", "segmented": true}.
+
+    Blank lines and lines starting with '#' are ignored; repeated IDs are dropped."""
+    entries = {}
+    duplicates = 0
+    with open(file_path, 'r', encoding='utf-8') as job_file:
+        for line_number, line in enumerate(job_file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            options = {}
+            if line.startswith('{'):
+                try:
+                    options = json.loads(line)
+                    line = options.get('link') or options['id']
+                except (ValueError, KeyError) as e:
+                    print(f"Skipping line {line_number}: invalid job entry ({e})")
+                    continue
+            try:
+                file_id = options.get('id') or link_to_id(line)
+            except ValueError as e:
+                print(f"Skipping line {line_number}: {e}")
+                continue
+            if file_id in entries:
+                duplicates += 1
+                continue
+            entries[file_id] = JobEntry(file_id, line, options.get('dest') or default_destination,
+                                        segmented=bool(options.get('segmented', False)))
+    if duplicates:
+        print(f"Ignored {duplicates} duplicate links in {file_path}")
+    return list(entries.values())
+
+class BatchJob:
+    """Download many links headlessly through one shared pair of schedulers.
+
+    Metadata for all links is fetched in batch requests (100 links per call) to
+    tell files from folders; then folders go to the shared listers and files
+    straight to the shared download pool, so every link runs in parallel under
+    the bulker's global concurrency limits.
+    """
+    def __init__(self, bulker):
+        self.bulker = bulker
+        self.manifests = {}  # destination -> DownloadManifest
+
+    def manifest(self, destination):
+        if destination not in self.manifests:
+            self.manifests[destination] = DownloadManifest(destination)
+        return self.manifests[destination]
+
+    def resolve(self, entries):
+        """Fill in drive_file for every entry; returns the entries that could be resolved."""
+        batch = DriveBatch(self.bulker.session, self.bulker.get_headers)
+        calls = [batch.add('GET', f'/drive/v3/files/{entry.file_id}', params={'fields': FILE_FIELDS}) for entry in entries]
+        batch.execute()
+
+        resolved = []
+        for entry, call in zip(entries, calls):
+            if call.ok:
+                entry.drive_file = DriveFile.from_json(call.result)
+                resolved.append(entry)
+            else:
+                print(f"Could not resolve {entry.link} (status {call.status})")
+        return resolved
+
+    def run(self, entries):
+        """Download every entry; returns (completed, failed) task counts."""
+        bulker = self.bulker
+        print(f"Resolving {len(entries)} links...")
+        resolved = self.resolve(entries)
+        unresolved = len(entries) - len(resolved)
+
+        bulker.download_slots.set_maximum(bulker.max_downloader_count)
+        try:
+            with TransferScheduler(worker_count=bulker.max_downloader_count, name='download') as downloads, \
+                 TransferScheduler(worker_count=bulker.max_lister_count, queue_size=0, name='listing') as listings:
+                files = {}  # destination -> file entries
+                for entry in resolved:
+                    drive_file = entry.drive_file
+                    if drive_file.mime_type == bulker.folder_mime_type:
+                        folder_path = os.path.join(entry.destination, sanitizer_names(drive_file.name))
+                        listings.submit(bulker.queue_folder, drive_file.id, folder_path, listings, downloads, self.manifest(entry.destination))
+                    else:
+                        files.setdefault(entry.destination, []).append(entry)
+
+                skipped = 0
+                for destination, file_entries in files.items():
+                    manifest = self.manifest(destination)
+                    # one index query per destination decides which files are already done
+                    known = manifest.lookup_many(entry.file_id for entry in file_entries)
+                    for entry in file_entries:
+                        local_path = os.path.join(destination, sanitizer_names(entry.drive_file.name))
+                        if manifest.is_complete(entry.drive_file, local_path, known.get(entry.file_id)):
+                            skipped += 1
+                        else:
+                            metrics.file_queued()
+                            downloads.submit(bulker.tracked_downloader, entry.drive_file, destination, manifest, segmented=entry.segmented)
+                if skipped:
+                    print(f"Skipped {skipped} linked files already in their manifest")
+                listings.join()
+                downloads.join()
+                # downloads.failed includes files tracked_downloader gave up on
+                failed = downloads.failed + listings.failed + unresolved
+                completed = downloads.completed
+        finally:
+            for manifest in self.manifests.values():
+                manifest.close()
+            self.manifests = {}
+
+        print(f"Batch job finished: {completed} downloads done, {failed} failed.")
+        return completed, failed
@@ -1,9 +1,18 @@
+import os
+
 # Hardcoded client secrets
 CLIENT_ID = "536928240285-40ismk9563ng6rd3oggejn1lhbs46vb2.apps.googleusercontent.com"
 CLIENT_SECRET = "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"
 REDIRECT_URI = "urn:ietf:wg:oauth:2.0:oob"
 
+# Drive API host, overridable to point the tool at a local fake server (see Fake_Drive.py)
+API_ROOT = os.environ.get('GDRIVE_API_ROOT', 'https://www.googleapis.com').rstrip('/')
+
 #files listing
 
 USER_AUTH_FILE = 'UserData/user_auth.json'
-TOKEN_FILE = 'UserData/tokens.json'
\ No newline at end of file
+TOKEN_FILE = 'UserData/tokens.json'
+UPLOAD_SESSIONS_FILE = 'UserData/upload_sessions.json'
+HASH_CACHE_FILE = 'UserData/hash_cache.sqlite'
+ACCOUNT_USAGE_FILE = 'UserData/account_usage.json'
+JOBS_DIR = 'UserData/jobs'
@@ -0,0 +1,90 @@
+import time, threading
+from requests.auth import AuthBase
+from DriveLoader.Trace_Hooks import tracer
+
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+
+class DriveCredentials(AuthBase):
+    """Thread-safe OAuth access token that refreshes itself shortly before it expires.
+
+    Shared by every worker of an account: only one of them performs a refresh
+    while the rest wait for its result. Used as a requests auth object, a 401
+    response triggers one transparent refresh and resend of the request.
+    """
+    def __init__(self, refresh_token=None, client_id=None, client_secret=None, email=None,
+                 access_token=None, expiry=0.0, on_refresh=None, refresh_margin=300):
+        self.refresh_token = refresh_token
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.email = email
+        self.access_token = access_token
+        self.expiry = expiry  # unix time, 0 = unknown
+        self.on_refresh = on_refresh  # called as on_refresh(credentials) after each refresh
+        self.refresh_margin = refresh_margin
+        self.lock = threading.Lock()
+
+    @property
+    def valid(self):
+        if not self.access_token:
+            return False
+        # a token of unknown age (plain string) is trusted until a 401 says otherwise
+        return not self.expiry or time.time() < self.expiry - self.refresh_margin
+
+    def token(self):
+        """Current access token, refreshed first if it is about to expire."""
+        if not self.valid and self.refresh_token:
+            self.refresh(stale_token=self.access_token)
+        return self.access_token
+
+    def headers(self):
+        return {'Authorization': f'Bearer {self.token()}'}
+
+    def refresh(self, stale_token=None):
+        """Get a new access token; a no-op if another thread already replaced `stale_token`."""
+        with self.lock, tracer.span('token refresh', 'auth', email=self.email):
+            if stale_token is not None and self.access_token != stale_token and self.valid:
+                return
+            if not self.refresh_token:
+                raise ValueError(f"No refresh token available for {self.email or 'this token'}.")
+
+            from DriveLoader.Http_Session import get_session
+            response = get_session().post(TOKEN_URI, data={
+                'grant_type': 'refresh_token',
+                'refresh_token': self.refresh_token,
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+            })
+            response.raise_for_status()
+            token_json = response.json()
+            self.access_token = token_json['access_token']
+            self.expiry = time.time() + int(token_json.get('expires_in', 3600))
+        if self.on_refresh:
+            self.on_refresh(self)
+
+    def __call__(self, request):
+        token = self.token()
+        request.headers['Authorization'] = f'Bearer {token}'
+        request.register_hook('response', self._handle_401)
+        request._drive_token = token
+        return request
+
+    def _handle_401(self, response, **kwargs):
+        request = response.request
+        if response.status_code != 401 or not self.refresh_token or getattr(request, '_drive_retried', False):
+            return response
+        self.refresh(stale_token=getattr(request, '_drive_token', None))
+
+        # drain and release the connection, then resend once with the new token
+        response.content
+        response.close()
+        retry = request.copy()
+        retry.headers['Authorization'] = f'Bearer {self.access_token}'
+        retry._drive_retried = True
+        new_response = response.connection.send(retry, **kwargs)
+        new_response.history.append(response)
+        new_response.request = retry
+        return new_response
+
+def as_credentials(value):
+    """Wrap a bare access token string so callers may pass either form."""
+    return value if isinstance(value, DriveCredentials) else DriveCredentials(access_token=value)
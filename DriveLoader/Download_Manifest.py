@@ -0,0 +1,183 @@
+import os, json, sqlite3, threading
+from DriveLoader.Local_Hasher import md5_of_file
+
+MANIFEST_NAME = '.gdrive_manifest.sqlite'
+
+def part_revision(drive_file):
+    return {'id': drive_file.id, 'size': drive_file.size, 'md5': drive_file.md5_checksum, 'modified': drive_file.modified_time}
+
+def prepare_part(drive_file, part_path):
+    """Drop a leftover .part (and segment map) of another revision of the file, then record the current one.
+
+    The revision sits in a `.part.meta` sidecar; leftovers without one are of unknown
+    origin and are discarded too, appending to them could mix two versions of the file."""
+    meta_path = part_path + '.meta'
+    leftovers = [path for path in (part_path, part_path + '.segments') if os.path.exists(path)]
+    if leftovers:
+        try:
+            with open(meta_path, 'r') as meta_file:
+                saved = json.load(meta_file)
+        except (OSError, ValueError):
+            saved = None
+        if saved != part_revision(drive_file):
+            print(f"Discarding partial download of {drive_file.name}: the file changed on Drive since.")
+            for path in leftovers:
+                os.remove(path)
+    with open(meta_path, 'w') as meta_file:
+        json.dump(part_revision(drive_file), meta_file)
+
+def part_verified(drive_file, part_path):
+    """True when a finished .part matches the Drive md5; files without one (Google Docs) pass."""
+    return not drive_file.md5_checksum or md5_of_file(part_path) == drive_file.md5_checksum
+
+def discard_part(part_path):
+    for path in (part_path, part_path + '.segments', part_path + '.meta'):
+        if os.path.exists(path):
+            os.remove(path)
+
+class DownloadManifest:
+    """SQLite index of everything downloaded under one root, keyed by Drive file ID.
+
+    Reruns compare each listing page against the index in one query, so files
+    that are already complete are skipped without a network call or a stat.
+    """
+    def __init__(self, root_path, flush_every=200):
+        os.makedirs(root_path, exist_ok=True)
+        self.db_path = os.path.join(root_path, MANIFEST_NAME)
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.pending = []  # completions not yet written
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                file_id TEXT PRIMARY KEY,
+                local_path TEXT NOT NULL,
+                size INTEGER,
+                md5_checksum TEXT,
+                modified_time TEXT,
+                state TEXT NOT NULL
+            )''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS folders (
+                folder_id TEXT PRIMARY KEY,
+                local_path TEXT NOT NULL
+            )''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                root_id TEXT PRIMARY KEY,
+                page_token TEXT NOT NULL
+            )''')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def lookup_many(self, file_ids):
+        """Return {file_id: (local_path, size, md5_checksum, modified_time, state)} for the known IDs."""
+        file_ids = list(file_ids)
+        found = {}
+        with self.lock:
+            self._flush()
+            # stay below SQLite's bound-parameter limit
+            for i in range(0, len(file_ids), 500):
+                batch = file_ids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.conn.execute(
+                    f'SELECT file_id, local_path, size, md5_checksum, modified_time, state FROM files WHERE file_id IN ({placeholders})',
+                    batch)
+                for row in rows:
+                    found[row[0]] = row[1:]
+        return found
+
+    def is_complete(self, drive_file, local_path, entry):
+        """True when a lookup_many entry shows this exact revision finished at local_path."""
+        if entry is None:
+            return False
+        path, size, md5_checksum, modified_time, state = entry
+        return (state == 'complete' and path == local_path and size == drive_file.size
+                and md5_checksum == drive_file.md5_checksum and modified_time == drive_file.modified_time)
+
+    def mark(self, drive_file, local_path, state='complete'):
+        with self.lock:
+            self.pending.append((drive_file.id, local_path, drive_file.size, drive_file.md5_checksum, drive_file.modified_time, state))
+            if len(self.pending) >= self.flush_every:
+                self._flush()
+
+    def forget(self, file_id):
+        with self.lock:
+            self._flush()
+            self.conn.execute('DELETE FROM files WHERE file_id = ?', (file_id,))
+            self.conn.commit()
+
+    def get(self, file_id):
+        """Single-ID form of lookup_many, or None."""
+        return self.lookup_many([file_id]).get(file_id)
+
+    def mark_folder(self, folder_id, local_path):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO folders VALUES (?, ?)', (folder_id, local_path))
+            self.conn.commit()
+
+    def folder_path(self, folder_id):
+        with self.lock:
+            row = self.conn.execute('SELECT local_path FROM folders WHERE folder_id = ?', (folder_id,)).fetchone()
+        return row[0] if row else None
+
+    def move_folder(self, old_path, new_path):
+        """Rewrite the local paths of a folder and everything below it after a rename/move."""
+        with self.lock:
+            self._flush()
+            for table in ('files', 'folders'):
+                self.conn.execute(
+                    f'UPDATE {table} SET local_path = ? || substr(local_path, ?) WHERE local_path = ? OR substr(local_path, 1, ?) = ?',
+                    (new_path, len(old_path) + 1, old_path, len(old_path) + 1, old_path + os.sep))
+            self.conn.commit()
+
+    def forget_folder(self, local_path):
+        """Drop a folder and everything below it from the index."""
+        with self.lock:
+            self._flush()
+            for table in ('files', 'folders'):
+                # prefix match without LIKE, paths are full of '_' wildcards
+                self.conn.execute(f'DELETE FROM {table} WHERE local_path = ? OR substr(local_path, 1, ?) = ?',
+                                  (local_path, len(local_path) + 1, local_path + os.sep))
+            self.conn.commit()
+
+    def failed_files(self):
+        """[(file_id, local_path)] of downloads recorded with state 'failed'."""
+        with self.lock:
+            self._flush()
+            return self.conn.execute("SELECT file_id, local_path FROM files WHERE state = 'failed'").fetchall()
+
+    def forget_sync_token(self, root_id):
+        with self.lock:
+            self.conn.execute('DELETE FROM sync_state WHERE root_id = ?', (root_id,))
+            self.conn.commit()
+
+    def get_sync_token(self, root_id):
+        with self.lock:
+            row = self.conn.execute('SELECT page_token FROM sync_state WHERE root_id = ?', (root_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_sync_token(self, root_id, page_token):
+        with self.lock:
+            self._flush()
+            self.conn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (root_id, page_token))
+            self.conn.commit()
+
+    def _flush(self):
+        if self.pending:
+            self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', self.pending)
+            self.conn.commit()
+            self.pending = []
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.conn.close()
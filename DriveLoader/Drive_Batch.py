@@ -0,0 +1,144 @@
+import json, time, uuid
+from urllib.parse import urlencode
+import requests
+from DriveLoader.Retry_Policy import RetryPolicy, classify_status
+from DriveLoader.Transfer_Metrics import metrics
+from DriveLoader.Trace_Hooks import tracer
+from DriveLoader.Client_Credentials import API_ROOT
+
+BATCH_URL = f'{API_ROOT}/batch/drive/v3'
+MAX_BATCH_SIZE = 100  # Drive's limit per batch request
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'PATCH', 'DELETE')
+
+class BatchCall:
+    """One sub-request of a batch; status and body are filled in by DriveBatch.execute.
+
+    `recover(call)` lets a failed POST be resent safely: it looks for what the
+    call would have created and returns its JSON, or None if there is nothing.
+    """
+    def __init__(self, method, path, params=None, body=None, recover=None):
+        self.method = method
+        self.path = path  # e.g. /drive/v3/files/<id>
+        self.params = params
+        self.body = body
+        self.recover = recover
+        self.status = None
+        self.result = None
+
+    @property
+    def ok(self):
+        return self.status is not None and 200 <= self.status < 300
+
+    def to_http(self):
+        path = self.path
+        if self.params:
+            path += '?' + urlencode(self.params)
+        lines = [f'{self.method} {path} HTTP/1.1']
+        payload = ''
+        if self.body is not None:
+            payload = json.dumps(self.body)
+            lines.append('Content-Type: application/json; charset=UTF-8')
+        return '\r\n'.join(lines) + '\r\n\r\n' + payload
+
+class DriveBatch:
+    """Coalesce Drive metadata calls into multipart/mixed batch requests.
+
+    Calls are sent up to 100 at a time; each BatchCall gets its own status and
+    parsed JSON back, and only sub-requests that failed with a retryable status
+    are sent again. A POST is not idempotent: after a network error or 5xx it is
+    only resent when its `recover` found nothing, otherwise it is left failed.
+    """
+    def __init__(self, session, get_headers, max_retries=5):
+        self.session = session
+        self.get_headers = get_headers
+        self.max_retries = max_retries
+        self.retry_policy = RetryPolicy(max_retries=max_retries)
+        self.calls = []
+
+    def add(self, method, path, params=None, body=None, recover=None):
+        call = BatchCall(method, path, params, body, recover)
+        self.calls.append(call)
+        return call
+
+    def execute(self):
+        """Send all queued calls and return them in the order they were added."""
+        calls, self.calls = self.calls, []
+        pending = list(calls)
+        for attempt in range(self.max_retries):
+            for i in range(0, len(pending), MAX_BATCH_SIZE):
+                self._send(pending[i:i + MAX_BATCH_SIZE])
+            # same rules as single requests: quota errors and 5xx are retried, permission errors are not
+            kinds = [(call, classify_status(call.status, call.result)) for call in pending if not call.ok]
+            kinds = [(call, kind) for call, kind in kinds if kind != 'fatal' and self._resendable(call, kind)]
+            pending = [call for call, _ in kinds]
+            if not pending:
+                break
+            print(f"Retrying {len(pending)} failed batch calls... ({attempt + 1}/{self.max_retries})")
+            for _, kind in kinds:
+                metrics.retry(kind)
+            with tracer.span('retry backoff', 'retry', calls=len(pending), attempt=attempt):
+                time.sleep(self.retry_policy.delay(attempt))
+        return calls
+
+    def _resendable(self, call, kind):
+        if call.method in IDEMPOTENT_METHODS or kind == 'rate_limit':
+            return True  # throttled calls were never carried out
+        if call.recover is None:
+            return False
+        # the first attempt may have gone through before the error
+        found = call.recover(call)
+        if found is None:
+            return True
+        call.status, call.result = 200, found
+        return False
+
+    def _send(self, calls):
+        boundary = f'batch_{uuid.uuid4().hex}'
+        parts = []
+        for index, call in enumerate(calls):
+            parts.append(f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <item-{index}>\r\n\r\n{call.to_http()}\r\n')
+        payload = ''.join(parts) + f'--{boundary}--\r\n'
+
+        headers = self.get_headers()
+        headers['Content-Type'] = f'multipart/mixed; boundary={boundary}'
+        try:
+            response = self.session.post(BATCH_URL, headers=headers, data=payload.encode('utf-8'))
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Batch request failed: {e}")
+            for call in calls:
+                call.status = None
+            return
+
+        for content_id, status, body in parse_multipart(response):
+            if content_id is None or not content_id.startswith('response-item-'):
+                continue
+            call = calls[int(content_id[len('response-item-'):])]
+            call.status = status
+            try:
+                call.result = json.loads(body) if body.strip() else None
+            except ValueError:
+                call.result = body
+
+def parse_multipart(response):
+    """Yield (content_id, http_status, body) for each part of a multipart/mixed batch response."""
+    content_type = response.headers.get('Content-Type', '')
+    boundary = content_type.split('boundary=')[-1].strip('"')
+    text = response.content.decode('utf-8')
+    for part in text.split(f'--{boundary}'):
+        part = part.strip('\r\n')
+        if not part or part == '--':
+            continue
+        part_headers, _, http_response = part.partition('\r\n\r\n')
+        content_id = None
+        for line in part_headers.split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-id':
+                content_id = value.strip().strip('<>')
+        status_block, _, body = http_response.partition('\r\n\r\n')
+        status_line = status_block.split('\r\n', 1)[0]
+        try:
+            status = int(status_line.split(' ')[1])
+        except (IndexError, ValueError):
+            status = None
+        yield content_id, status, body
@@ -1,31 +1,36 @@
-import requests
+from DriveLoader.Http_Session import get_session
+from DriveLoader.Credential_Manager import as_credentials
 from UserControl import UserControl
 from DriveLoader.Gdrive_Downloader import Gdrive_Bulker
 from DriveLoader.Gdrive_Uploader import GdriveUploader
 from functions import clear_console
+from DriveLoader.Client_Credentials import API_ROOT
+from DriveLoader.Retry_Policy import RetryPolicy
 
 class DriveBrowser:
-    def __init__(self, access_token):
-        self.access_token = access_token
+    def __init__(self, credentials):
+        self.credentials = as_credentials(credentials)
 
         #object encap
-        self.downloader = Gdrive_Bulker(access_token=self.access_token) #downloader object
-        self.uploader = GdriveUploader(access_token=self.access_token) #uploader object
+        self.downloader = Gdrive_Bulker(credentials=self.credentials) #downloader object
+        self.uploader = GdriveUploader(credentials=self.credentials) #uploader object
         
+        self.session = get_session(credentials=self.credentials)
+        self.retry_policy = RetryPolicy()
         self.folder_history = []  # To keep track of folder navigation
     
-    def token_reset(self, access_token):
-        self.access_token = access_token
+    def token_reset(self, credentials):
+        self.credentials = as_credentials(credentials)
+        self.session = get_session(credentials=self.credentials)
         #re ref
-        self.downloader.access_token = self.access_token
-        self.uploader.access_token = self.access_token
+        self.downloader.set_credentials(self.credentials)
+        self.uploader.set_credentials(self.credentials)
 
     def get_list_files(self, parent_folder_id='root'):
         """Helper method to list files/folders by name within a parent folder."""
         try:
-            url = f"https://www.googleapis.com/drive/v3/files?q='{parent_folder_id}' in parents and trashed=false&fields=files(kind,id,name,size,mimeType)"
-            response = requests.get(url, headers={'Authorization': f'Bearer {self.access_token}'})
-            response.raise_for_status()
+            url = f"{API_ROOT}/drive/v3/files?q='{parent_folder_id}' in parents and trashed=false&fields=files(kind,id,name,size,mimeType)"
+            response = self.retry_policy.request(self.session, 'GET', url, headers=self.credentials.headers())
             return response.json().get('files', [])
         except Exception as e:
             print(f"Error: {e}")
@@ -66,7 +71,7 @@ class DriveBrowser:
             print("[v<number>] to view file details, [cf] to create a folder")
             print("[d<number>] to download a file, [dcf<number>] to download current folder")
             print("[usf<number>] to upload a single file, [u] to upload a folder")
-            print("[del<number>] to delete a file/folder")
+            print("[del<number>] to delete a file/folder, [del<n>,<n>,...] to delete several")
             print("'b' to go back, 'q' to quit")
 
             choice = input("\nYour choice: ").strip()
@@ -86,12 +91,16 @@ class DriveBrowser:
             elif choice.startswith('del'):  # Delete a folder
                 clear_console()
                 try:
-                    choice_num = int(choice[3:])  # Get the folder number
-                    selected_choice = combined_files[choice_num - 1]
-                    if selected_choice['mimeType'] == "application/vnd.google-apps.folder":
-                        self.delete_folder(selected_choice['id'])  # Delete the selected folder
+                    choice_nums = [int(num) for num in choice[3:].split(',')]  # Get the folder number(s)
+                    if len(choice_nums) > 1:
+                        # several at once go out as one batch request
+                        self.delete_many([combined_files[num - 1]['id'] for num in choice_nums])
                     else:
-                        self.delete_folder(selected_choice['id'], file=True)
+                        selected_choice = combined_files[choice_nums[0] - 1]
+                        if selected_choice['mimeType'] == "application/vnd.google-apps.folder":
+                            self.delete_folder(selected_choice['id'])  # Delete the selected folder
+                        else:
+                            self.delete_folder(selected_choice['id'], file=True)
                 
                 except (IndexError, ValueError):
                     print("\nInvalid folder number.")
@@ -202,12 +211,21 @@ class DriveBrowser:
         else:
             print("Enter correct folder id.")
 
+    def delete_many(self, file_ids):
+        """Delete several files/folders from Google Drive with batched requests."""
+        try:
+            failed = self.uploader.delete_files(file_ids)
+            if failed:
+                print(f"Could not delete: {', '.join(failed)}")
+        except Exception as e:
+            print(f"Deletion Error: {e}")
+
     def delete_folder(self, folder_id, file=False):
         """Delete a folder from Google Drive."""
         try:
-            url = f"https://www.googleapis.com/drive/v3/files/{folder_id}"
-            response = requests.delete(url, headers={'Authorization': f'Bearer {self.access_token}'})
+            url = f"{API_ROOT}/drive/v3/files/{folder_id}"
+            response = self.session.delete(url, headers=self.credentials.headers())
             response.raise_for_status()
-            print(f"{'Folder' if not file else "File"} with ID: {folder_id} has been deleted successfully.")
+            print(f"{'Folder' if not file else 'File'} with ID: {folder_id} has been deleted successfully.")
         except Exception as e:
             print(f"Deletion Error: {e}")
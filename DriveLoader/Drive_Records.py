@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from typing import Optional
+
+# fields requested for every file so the download stage never has to ask again
+FILE_FIELDS = 'id, name, mimeType, size, md5Checksum, modifiedTime'
+GOOGLE_APPS_MIME_PREFIX = 'application/vnd.google-apps.'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+@dataclass
+class DriveFile:
+    """Metadata of a single Drive entry, as returned by files.list / files.get."""
+    id: str
+    name: str
+    mime_type: str
+    size: Optional[int] = None
+    md5_checksum: Optional[str] = None
+    modified_time: Optional[str] = None
+
+    @property
+    def google_native(self):
+        """Docs, Sheets, shortcuts...: no stored bytes, alt=media refuses them."""
+        return self.mime_type.startswith(GOOGLE_APPS_MIME_PREFIX) and self.mime_type != FOLDER_MIME_TYPE
+
+    @classmethod
+    def from_json(cls, data):
+        size = data.get('size')
+        return cls(
+            id=data['id'],
+            name=data['name'],
+            mime_type=data.get('mimeType', ''),
+            size=int(size) if size is not None else None,
+            md5_checksum=data.get('md5Checksum'),
+            modified_time=data.get('modifiedTime'),
+        )
@@ -0,0 +1,242 @@
+import os, shutil
+import requests
+from functions import sanitizer_names
+from DriveLoader.Drive_Records import DriveFile, FILE_FIELDS
+from DriveLoader.Download_Manifest import DownloadManifest
+from DriveLoader.Transfer_Scheduler import TransferScheduler
+
+class DriveMirror:
+    """Keep a local copy of a Drive folder current using the Changes API.
+
+    The first run does a full download_folder and stores a startPageToken in the
+    root's manifest. Later runs only fetch changes.list since that token and apply
+    them locally (download, rename/move, delete), so cost follows churn, not tree size.
+    Downloads that fail are kept in the manifest with state 'failed' and retried
+    by the next sync, since the token has already moved past their change. A folder
+    moved in from outside the mirror is crawled, and the token only advances once
+    that crawl has finished.
+    """
+    def __init__(self, bulker, root_folder_id, root_path):
+        self.bulker = bulker  # Gdrive_Bulker, provides session, token and downloads
+        self.root_folder_id = root_folder_id
+        self.root_path = root_path
+
+    def start_page_token(self):
+        url = f'{self.bulker.base_url}/changes/startPageToken'
+        response = self.bulker.retry_policy.request(self.bulker.session, 'GET', url, headers=self.bulker.get_headers())
+        return response.json()['startPageToken']
+
+    def list_changes(self, page_token):
+        """Return (changes since page_token, the token to store for the next run)."""
+        url = f'{self.bulker.base_url}/changes'
+        changes = []
+        while True:
+            params = {
+                'pageToken': page_token,
+                'pageSize': self.bulker.page_size,
+                'includeRemoved': 'true',
+                'spaces': 'drive',
+                'fields': f'nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}, parents, trashed))',
+            }
+            response = self.bulker.retry_policy.request(self.bulker.session, 'GET', url, headers=self.bulker.get_headers(), params=params)
+            changes_json = response.json()
+            changes.extend(changes_json.get('changes', []))
+            if 'newStartPageToken' in changes_json:
+                return changes, changes_json['newStartPageToken']
+            page_token = changes_json['nextPageToken']
+
+    def sync(self):
+        """Bring the local mirror up to date, doing a full download on the first run."""
+        with DownloadManifest(self.root_path) as manifest:
+            page_token = manifest.get_sync_token(self.root_folder_id)
+
+        if page_token is None:
+            # take the token first so nothing changed during the crawl is missed; an unfinished
+            # crawl keeps it, and the next sync resumes the crawl from its job journal
+            pending_key = f'{self.root_folder_id}:initial'
+            with DownloadManifest(self.root_path) as manifest:
+                page_token = manifest.get_sync_token(pending_key)
+                if page_token is None:
+                    page_token = self.start_page_token()
+                    manifest.set_sync_token(pending_key, page_token)
+            print("No sync state found, mirroring the whole folder first...")
+            if not self.bulker.download_folder(self.root_folder_id, self.root_path):
+                print("The first mirror is incomplete; run sync again to resume it.")
+                return
+            with DownloadManifest(self.root_path) as manifest:
+                manifest.set_sync_token(self.root_folder_id, page_token)
+                manifest.forget_sync_token(pending_key)
+            return
+
+        changes, new_page_token = self.list_changes(page_token)
+        print(f"{len(changes)} changes since last sync.")
+        with DownloadManifest(self.root_path) as manifest:
+            changed = {change['fileId'] for change in changes}
+            retries = [(file_id, local_path) for file_id, local_path in manifest.failed_files() if file_id not in changed]
+            if retries:
+                print(f"Retrying {len(retries)} downloads that failed in an earlier sync.")
+            if not self.apply_changes(changes, manifest, retries):
+                print("Some folders could not be crawled; run sync again to finish them.")
+                return
+            manifest.set_sync_token(self.root_folder_id, new_page_token)
+
+    def apply_changes(self, changes, manifest, retries=()):
+        """Apply a page of changes; False when a folder that came into the mirror was not fully crawled."""
+        # folders first, repeatedly, so a new folder is placed before its new children
+        folder_changes, file_changes = [], []
+        for change in changes:
+            file_json = change.get('file') or {}
+            # removals carry no mimeType, recognise folders by the index instead
+            if file_json.get('mimeType') == self.bulker.folder_mime_type or (
+                    not file_json and manifest.folder_path(change['fileId']) is not None):
+                folder_changes.append(change)
+            else:
+                file_changes.append(change)
+
+        crawls = []
+        pending = folder_changes
+        while pending:
+            remaining = [c for c in pending if not self.apply_folder_change(c, manifest, crawls)]
+            if len(remaining) == len(pending):
+                break
+            pending = remaining
+        for change in pending:
+            # parent never showed up inside the mirror: moved out, or never ours
+            self.remove_folder(change['fileId'], manifest)
+
+        # before the file changes, so files the crawl already fetched are seen as unchanged
+        crawled = self.crawl_folders(crawls, manifest) if crawls else True
+
+        with TransferScheduler(worker_count=self.bulker.max_downloader_count, name='sync') as scheduler:
+            for change in file_changes:
+                self.apply_file_change(change, manifest, scheduler)
+            for file_id, local_path in retries:
+                scheduler.submit(self.retry_download, file_id, local_path, manifest)
+            scheduler.join()
+        return crawled
+
+    def crawl_folders(self, folders, manifest):
+        """List and download folders the manifest knew nothing about; True when nothing failed."""
+        with TransferScheduler(worker_count=self.bulker.max_downloader_count, name='download') as downloads, \
+             TransferScheduler(worker_count=self.bulker.max_lister_count, queue_size=0, name='listing') as listings:
+            for folder_id, folder_path in folders:
+                print(f"Crawling {folder_path}, it came into the mirror from outside")
+                listings.submit(self.bulker.queue_folder, folder_id, folder_path, listings, downloads, manifest)
+            listings.join()
+            downloads.join()
+        if listings.failed or downloads.failed:
+            return False
+        for folder_id, _ in folders:
+            manifest.forget_sync_token(f'{folder_id}:crawl')
+        return True
+
+    def download(self, drive_file, parent_path, manifest):
+        """tracked_downloader that records a failure in the manifest for the next sync."""
+        ok = False
+        try:
+            ok = self.bulker.tracked_downloader(drive_file, parent_path, manifest)
+        finally:
+            if not ok:
+                manifest.mark(drive_file, os.path.join(parent_path, sanitizer_names(drive_file.name)), state='failed')
+        return ok
+
+    def retry_download(self, file_id, local_path, manifest):
+        try:
+            drive_file = self.bulker.file_metadata(file_id)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                manifest.forget(file_id)  # gone from Drive meanwhile
+                return
+            raise
+        self.download(drive_file, os.path.dirname(local_path), manifest)
+
+    def parent_path(self, file_json, manifest):
+        for parent_id in file_json.get('parents', []):
+            parent_path = manifest.folder_path(parent_id)
+            if parent_path is not None:
+                return parent_path
+        return None
+
+    def apply_folder_change(self, change, manifest, crawls):
+        """Apply a folder change; False means its parent is not known (yet).
+
+        Folders new to the mirror are added to `crawls` as (folder_id, path)."""
+        folder_id = change['fileId']
+        if folder_id == self.root_folder_id:
+            return True
+        file_json = change.get('file')
+        if change.get('removed') or file_json is None or file_json.get('trashed'):
+            self.remove_folder(folder_id, manifest)
+            return True
+
+        parent_path = self.parent_path(file_json, manifest)
+        if parent_path is None:
+            return False
+
+        new_path = os.path.join(parent_path, sanitizer_names(file_json['name']))
+        old_path = manifest.folder_path(folder_id)
+        if old_path and old_path != new_path and os.path.exists(old_path):
+            print(f"Moving folder {old_path} -> {new_path}")
+            os.makedirs(parent_path, exist_ok=True)
+            os.replace(old_path, new_path)
+            manifest.move_folder(old_path, new_path)
+        # a crawl that did not finish last time keeps its marker, so the replayed change crawls again
+        crawl_key = f'{folder_id}:crawl'
+        if old_path is None or manifest.get_sync_token(crawl_key) is not None:
+            # subfolders of a folder being crawled are reached by that crawl
+            if not any(new_path.startswith(path + os.sep) for _, path in crawls):
+                manifest.set_sync_token(crawl_key, new_path)
+                crawls.append((folder_id, new_path))
+        os.makedirs(new_path, exist_ok=True)
+        manifest.mark_folder(folder_id, new_path)
+        return True
+
+    def remove_folder(self, folder_id, manifest):
+        local_path = manifest.folder_path(folder_id)
+        if local_path is None:
+            return
+        print(f"Removing folder {local_path}")
+        shutil.rmtree(local_path, ignore_errors=True)
+        manifest.forget_folder(local_path)
+
+    def apply_file_change(self, change, manifest, scheduler):
+        file_id = change['fileId']
+        file_json = change.get('file')
+        entry = manifest.get(file_id)
+        old_path = entry[0] if entry else None
+
+        parent_path = None
+        if not (change.get('removed') or file_json is None or file_json.get('trashed')):
+            parent_path = self.parent_path(file_json, manifest)
+
+        if parent_path is None:
+            # deleted, trashed or moved out of the mirror
+            if old_path:
+                print(f"Removing {old_path}")
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+                manifest.forget(file_id)
+            return
+
+        drive_file = DriveFile.from_json(file_json)
+        if drive_file.google_native:
+            return  # no bytes to mirror
+        new_path = os.path.join(parent_path, sanitizer_names(drive_file.name))
+        same_revision = entry is not None and manifest.is_complete(drive_file, old_path, entry)
+
+        if same_revision and old_path == new_path:
+            return
+        if same_revision and os.path.exists(old_path):
+            # renamed or moved, content unchanged
+            print(f"Moving {old_path} -> {new_path}")
+            os.makedirs(parent_path, exist_ok=True)
+            os.replace(old_path, new_path)
+            manifest.mark(drive_file, new_path)
+            return
+
+        if old_path and old_path != new_path and os.path.exists(old_path):
+            os.remove(old_path)
+        if os.path.exists(new_path):
+            # stale content under the same name
+            os.remove(new_path)
+        scheduler.submit(self.download, drive_file, parent_path, manifest)
@@ -0,0 +1,482 @@
+import re, json, time, uuid, random, socket, hashlib, datetime, threading, collections
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from DriveLoader.Rate_Limiter import TokenBucket
+from DriveLoader.Transfer_Metrics import endpoint_name
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+PATTERN = bytes(range(256)) * 256  # 64 KiB of synthetic file content, repeated
+MEDIA_CHUNK = 64 * 1024
+QUERY_PARTS = re.compile(r"""'((?:[^'\\]|\\.)*)'\s+in\s+parents"""
+                         r"""|(name|mimeType)\s*(=|!=)\s*'((?:[^'\\]|\\.)*)'"""
+                         r"""|trashed\s*=\s*(true|false)""")
+
+def unescape(value):
+    return re.sub(r'\\(.)', r'\1', value)
+
+class FaultConfig:
+    """What the fake server does wrong on purpose.
+
+    latency: seconds added before every response
+    bandwidth: bytes/sec shared by all media responses (0 = unlimited)
+    error_rate: share of calls answered with 429 rateLimitExceeded
+    disconnect_rate: share of media downloads and upload chunks cut off halfway
+    """
+    def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0, disconnect_rate=0.0, retry_after=None, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.retry_after = retry_after  # seconds sent as Retry-After with injected 429s
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def chance(self, rate):
+        if not rate:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+    def cut_point(self, length):
+        with self.lock:
+            return self.random.randint(0, max(0, length - 1))
+
+class FakeFile:
+    """A file or folder held by FakeDrive; content=None means synthetic bytes of `size`.
+
+    `downloadable=False` makes alt=media answer 403 like a file flagged as abusive."""
+    def __init__(self, name, mime_type, parents, size=0, content=None, downloadable=True):
+        self.id = 'fake' + uuid.uuid4().hex[:24]
+        self.name = name
+        self.mime_type = mime_type
+        self.parents = parents
+        self.content = content
+        self.size = len(content) if content is not None else size
+        self.md5 = hashlib.md5(content).hexdigest() if content is not None else None
+        self.trashed = False
+        self.downloadable = downloadable
+        self.modified_time = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:-4] + 'Z'
+
+    @property
+    def is_folder(self):
+        return self.mime_type == FOLDER_MIME_TYPE
+
+    def read(self, start, end):
+        """Bytes start..end-1 of the file."""
+        if self.content is not None:
+            return self.content[start:end]
+        out = bytearray()
+        while start < end:
+            offset = start % len(PATTERN)
+            piece = PATTERN[offset:offset + (end - start)]
+            out += piece
+            start += len(piece)
+        return bytes(out)
+
+    def to_json(self):
+        data = {'kind': 'drive#file', 'id': self.id, 'name': self.name, 'mimeType': self.mime_type,
+                'parents': self.parents, 'modifiedTime': self.modified_time, 'trashed': self.trashed}
+        if not self.is_folder:
+            data['size'] = str(self.size)
+            if self.md5:
+                data['md5Checksum'] = self.md5
+        return data
+
+class MediaBody:
+    """alt=media response body, streamed by the handler so faults can hit mid-transfer."""
+    def __init__(self, drive_file, start, end):
+        self.drive_file = drive_file
+        self.start = start
+        self.end = end
+
+def json_body(status, data, headers=None):
+    headers = dict(headers or {})
+    headers['Content-Type'] = 'application/json; charset=UTF-8'
+    return status, headers, json.dumps(data).encode('utf-8')
+
+def error_body(status, reason, message):
+    return json_body(status, {'error': {'code': status, 'message': message,
+                                        'errors': [{'reason': reason, 'message': message}]}})
+
+class FakeDrive:
+    """In-memory stand-in for the subset of Drive v3 this tool uses.
+
+    Serves files.list (q on parents/name/mimeType, pagination), files.get with
+    alt=media and Range, files.create, files.update (PATCH: rename, move, trash),
+    files.delete, multipart and resumable
+    uploads, batch requests, changes and about, on localhost. Faults come from
+    FaultConfig and every call is counted per endpoint in `stats`. Point the
+    tool at it with GDRIVE_API_ROOT=<drive.url> before importing DriveLoader.
+    """
+    def __init__(self, faults=None, host='127.0.0.1', port=0):
+        self.faults = faults or FaultConfig()
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.files = {}
+        self.uploads = {}  # upload_id -> {'metadata', 'total', 'data', 'file'}
+        self.change_log = []  # (file_id, removed)
+        self.stats = collections.Counter()     # endpoint -> calls
+        self.injected = collections.Counter()  # fault -> times injected
+        self.bucket = TokenBucket(self.faults.bandwidth)
+        self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.server.server_address[1]}'
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), make_handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='fake-drive', daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def count_fault(self, fault):
+        with self.lock:
+            self.injected[fault] += 1
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+            self.injected.clear()
+
+    # --- tree building -------------------------------------------------------
+
+    def _add(self, drive_file):
+        with self.lock:
+            self.files[drive_file.id] = drive_file
+            self.change_log.append((drive_file.id, False))
+        return drive_file.id
+
+    def add_folder(self, name, parent='root'):
+        return self._add(FakeFile(name, FOLDER_MIME_TYPE, [parent]))
+
+    def add_file(self, name, parent='root', size=0, content=None, mime_type='application/octet-stream', downloadable=True):
+        return self._add(FakeFile(name, mime_type, [parent], size=size, content=content, downloadable=downloadable))
+
+    def children(self, folder_id):
+        with self.lock:
+            return [f for f in self.files.values() if folder_id in f.parents]
+
+    def _remove(self, file_id):
+        """Delete a file or a whole folder tree (caller holds the lock)."""
+        for child in [f for f in self.files.values() if file_id in f.parents]:
+            self._remove(child.id)
+        self.files.pop(file_id, None)
+        self.change_log.append((file_id, True))
+
+    # --- request dispatch ----------------------------------------------------
+
+    def dispatch(self, method, target, headers, body, batched=False):
+        """Answer one API call; returns (status, headers, bytes or MediaBody)."""
+        parts = urlsplit(target)
+        path = parts.path.rstrip('/')
+        query = {key: values[-1] for key, values in parse_qs(parts.query, keep_blank_values=True).items()}
+        label = ('batch ' if batched else '') + endpoint_name(method, path)
+        with self.lock:
+            self.stats[label] += 1
+
+        if self.faults.chance(self.faults.error_rate):
+            self.count_fault('429')
+            status, response_headers, payload = error_body(429, 'rateLimitExceeded', 'Rate Limit Exceeded')
+            if self.faults.retry_after is not None:
+                response_headers['Retry-After'] = str(self.faults.retry_after)
+            return status, response_headers, payload
+
+        segments = path.split('/')[1:]
+        if segments[:3] == ['drive', 'v3', 'files']:
+            file_id = segments[3] if len(segments) > 3 else None
+            if method == 'GET' and file_id is None:
+                return self.list_files(query)
+            if method == 'GET':
+                return self.get_file(file_id, query, headers)
+            if method == 'POST' and file_id is None:
+                return self.create_file(json.loads(body or b'{}'))
+            if method == 'PATCH' and file_id is not None:
+                return self.update_file(file_id, query, json.loads(body or b'{}'))
+            if method == 'DELETE':
+                return self.delete_file(file_id)
+        elif segments[:3] == ['drive', 'v3', 'changes']:
+            if segments[3:] == ['startPageToken']:
+                with self.lock:
+                    return json_body(200, {'startPageToken': str(len(self.change_log))})
+            return self.list_changes(query)
+        elif segments[:3] == ['drive', 'v3', 'about']:
+            return json_body(200, {'user': {'kind': 'drive#user', 'displayName': 'Fake User',
+                                            'emailAddress': 'fake@example.com'}})
+        elif segments[:4] == ['upload', 'drive', 'v3', 'files'] and not batched:
+            if method == 'POST' and query.get('uploadType') == 'multipart':
+                return self.multipart_upload(headers, body)
+            if method == 'POST' and query.get('uploadType') == 'resumable':
+                return self.start_resumable(json.loads(body or b'{}'), headers)
+            if method == 'PUT' and 'upload_id' in query:
+                return self.resumable_chunk(query['upload_id'], headers, body)
+        elif segments[:3] == ['batch', 'drive', 'v3'] and method == 'POST' and not batched:
+            return self.batch(headers, body)
+        return error_body(404, 'notFound', f'Unknown endpoint {method} {path}')
+
+    def list_files(self, query):
+        parents, conditions, trashed = [], [], None
+        for match in QUERY_PARTS.finditer(query.get('q', '')):
+            if match.group(1) is not None:
+                parents.append(unescape(match.group(1)))
+            elif match.group(2):
+                conditions.append((match.group(2), match.group(3), unescape(match.group(4))))
+            else:
+                trashed = match.group(5) == 'true'
+
+        with self.lock:
+            found = []
+            for f in self.files.values():
+                if any(parent not in f.parents for parent in parents) or (trashed is not None and f.trashed != trashed):
+                    continue
+                values = {'name': f.name, 'mimeType': f.mime_type}
+                if all((values[field] == value) == (op == '=') for field, op, value in conditions):
+                    found.append(f.to_json())
+
+        page_size = min(int(query.get('pageSize') or 100), 1000)
+        offset = int(query.get('pageToken') or 0)
+        result = {'kind': 'drive#fileList', 'files': found[offset:offset + page_size]}
+        if offset + page_size < len(found):
+            result['nextPageToken'] = str(offset + page_size)
+        return json_body(200, result)
+
+    def get_file(self, file_id, query, headers):
+        with self.lock:
+            drive_file = self.files.get(file_id)
+        if drive_file is None:
+            return error_body(404, 'notFound', f'File not found: {file_id}')
+        if query.get('alt') != 'media':
+            return json_body(200, drive_file.to_json())
+        if drive_file.mime_type.startswith('application/vnd.google-apps.'):
+            return error_body(403, 'fileNotDownloadable', 'Only files with binary content can be downloaded')
+        if not drive_file.downloadable:
+            return error_body(403, 'cannotDownloadAbusiveFile', 'This file has been identified as malware or spam')
+
+        size = drive_file.size
+        match = re.match(r'bytes=(\d+)-(\d*)$', headers.get('Range', '') or '')
+        if not match:
+            return 200, {'Content-Type': 'application/octet-stream'}, MediaBody(drive_file, 0, size)
+        start = int(match.group(1))
+        end = min(int(match.group(2)) + 1, size) if match.group(2) else size
+        if start >= size:
+            return 416, {'Content-Range': f'bytes */{size}'}, b''
+        return 206, {'Content-Type': 'application/octet-stream',
+                     'Content-Range': f'bytes {start}-{end - 1}/{size}'}, MediaBody(drive_file, start, end)
+
+    def create_file(self, metadata):
+        drive_file = FakeFile(metadata.get('name', 'Untitled'), metadata.get('mimeType') or 'application/octet-stream',
+                              metadata.get('parents') or ['root'], content=b'' if metadata.get('mimeType') != FOLDER_MIME_TYPE else None)
+        self._add(drive_file)
+        return json_body(200, drive_file.to_json())
+
+    def update_file(self, file_id, query, metadata):
+        """files.update: `name` and `trashed` from the body, addParents/removeParents from the query."""
+        with self.lock:
+            drive_file = self.files.get(file_id)
+            if drive_file is None:
+                return error_body(404, 'notFound', f'File not found: {file_id}')
+            if 'name' in metadata:
+                drive_file.name = metadata['name']
+            if 'trashed' in metadata:
+                drive_file.trashed = bool(metadata['trashed'])
+            removed = [p for p in query.get('removeParents', '').split(',') if p]
+            added = [p for p in query.get('addParents', '').split(',') if p]
+            drive_file.parents = [p for p in drive_file.parents if p not in removed] + \
+                                 [p for p in added if p not in drive_file.parents]
+            # metadata edits keep modifiedTime, like Drive does for renames and moves
+            self.change_log.append((file_id, False))
+            return json_body(200, drive_file.to_json())
+
+    def delete_file(self, file_id):
+        with self.lock:
+            if file_id not in self.files:
+                return error_body(404, 'notFound', f'File not found: {file_id}')
+            self._remove(file_id)
+        return 204, {}, b''
+
+    def list_changes(self, query):
+        offset = int(query.get('pageToken') or 0)
+        page_size = min(int(query.get('pageSize') or 100), 1000)
+        with self.lock:
+            log = self.change_log[offset:offset + page_size]
+            changes = []
+            for file_id, removed in log:
+                change = {'kind': 'drive#change', 'fileId': file_id, 'removed': removed or file_id not in self.files}
+                if not change['removed']:
+                    change['file'] = self.files[file_id].to_json()
+                changes.append(change)
+            result = {'kind': 'drive#changeList', 'changes': changes}
+            if offset + page_size < len(self.change_log):
+                result['nextPageToken'] = str(offset + page_size)
+            else:
+                result['newStartPageToken'] = str(len(self.change_log))
+        return json_body(200, result)
+
+    def multipart_upload(self, headers, body):
+        boundary = (headers.get('Content-Type') or '').split('boundary=')[-1].strip('"').encode()
+        sections = []
+        for part in body.split(b'--' + boundary):
+            if part.startswith(b'\r\n'):
+                part = part[2:]
+            if part.endswith(b'\r\n'):
+                part = part[:-2]
+            if not part or part == b'--':
+                continue
+            sections.append(part.partition(b'\r\n\r\n')[2])
+        if len(sections) != 2:
+            return error_body(400, 'badContent', 'Expected metadata and media parts')
+        metadata = json.loads(sections[0])
+        drive_file = FakeFile(metadata.get('name', 'Untitled'), metadata.get('mimeType') or 'application/octet-stream',
+                              metadata.get('parents') or ['root'], content=sections[1])
+        self._add(drive_file)
+        return json_body(200, drive_file.to_json())
+
+    def start_resumable(self, metadata, headers):
+        upload_id = uuid.uuid4().hex
+        total = headers.get('X-Upload-Content-Length')
+        with self.lock:
+            self.uploads[upload_id] = {'metadata': metadata, 'total': int(total) if total else None,
+                                       'data': bytearray(), 'file': None}
+        location = f'{self.url}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}'
+        return 200, {'Location': location, 'Content-Length': '0'}, b''
+
+    def resumable_chunk(self, upload_id, headers, body):
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None:
+            return error_body(404, 'notFound', 'Upload session not found')
+        if upload['file'] is not None:
+            return json_body(200, upload['file'].to_json())
+
+        match = re.match(r'bytes (\*|(\d+)-(\d+))/(\d+|\*)$', headers.get('Content-Range', '') or '')
+        if not match:
+            return error_body(400, 'badRange', 'Missing or invalid Content-Range')
+        if match.group(4) != '*':
+            upload['total'] = int(match.group(4))
+        data = upload['data']
+        if match.group(1) != '*':
+            start = int(match.group(2))
+            if start <= len(data):
+                del data[start:]
+                data += body
+
+        if upload['total'] is not None and len(data) >= upload['total']:
+            metadata = upload['metadata']
+            drive_file = FakeFile(metadata.get('name', 'Untitled'), metadata.get('mimeType') or 'application/octet-stream',
+                                  metadata.get('parents') or ['root'], content=bytes(data[:upload['total']]))
+            upload['file'] = drive_file
+            upload['data'] = bytearray()
+            self._add(drive_file)
+            return json_body(200, drive_file.to_json())
+        response_headers = {'Content-Length': '0'}
+        if data:
+            response_headers['Range'] = f'bytes=0-{len(data) - 1}'
+        return 308, response_headers, b''
+
+    def batch(self, headers, body):
+        boundary = (headers.get('Content-Type') or '').split('boundary=')[-1].strip('"')
+        parts = [part.strip('\r\n') for part in body.decode('utf-8').split(f'--{boundary}')]
+        parts = [part for part in parts if part and part != '--']
+        if len(parts) > 100:
+            return error_body(400, 'batchSizeTooLarge', 'A batch may hold at most 100 calls')
+        responses = []
+        for part in parts:
+            part_headers, _, http_request = part.partition('\r\n\r\n')
+            content_id = None
+            for line in part_headers.split('\r\n'):
+                name, _, value = line.partition(':')
+                if name.strip().lower() == 'content-id':
+                    content_id = value.strip().strip('<>')
+            request_head, _, request_body = http_request.partition('\r\n\r\n')
+            request_line, *header_lines = request_head.split('\r\n')
+            method, target = request_line.split(' ')[:2]
+            sub_headers = {name.strip(): value.strip() for name, _, value in
+                           (line.partition(':') for line in header_lines if ':' in line)}
+            responses.append((content_id, self.dispatch(method, target, sub_headers, request_body.encode('utf-8'), batched=True)))
+
+        out_boundary = f'batch_{uuid.uuid4().hex}'
+        chunks = []
+        for content_id, (status, _, payload) in responses:
+            reason = 'OK' if status < 300 else 'Error'
+            chunks.append(f'--{out_boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                          f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n'
+                          f'{payload.decode("utf-8")}\r\n')
+        chunks.append(f'--{out_boundary}--\r\n')
+        return 200, {'Content-Type': f'multipart/mixed; boundary={out_boundary}'}, ''.join(chunks).encode('utf-8')
+
+def make_handler(drive):
+    class FakeDriveHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def handle_call(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if drive.faults.latency:
+                time.sleep(drive.faults.latency)
+
+            if self.command == 'PUT' and body and drive.faults.chance(drive.faults.disconnect_rate):
+                # only part of the chunk arrives, then the connection drops without a response
+                drive.count_fault('disconnect')
+                drive.dispatch(self.command, self.path, self.headers, body[:drive.faults.cut_point(len(body))])
+                self.close_connection = True
+                return
+
+            status, headers, payload = drive.dispatch(self.command, self.path, self.headers, body)
+
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            if isinstance(payload, MediaBody):
+                self.send_media(payload)
+                return
+            if 'Content-Length' not in headers:
+                self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def send_media(self, media):
+            length = media.end - media.start
+            self.send_header('Content-Length', str(length))
+            self.end_headers()
+            stop = media.end
+            if length and drive.faults.chance(drive.faults.disconnect_rate):
+                drive.count_fault('disconnect')
+                stop = media.start + drive.faults.cut_point(length)
+            position = media.start
+            try:
+                while position < stop:
+                    chunk = media.drive_file.read(position, min(position + MEDIA_CHUNK, stop))
+                    drive.bucket.consume(len(chunk))
+                    self.wfile.write(chunk)
+                    position += len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+                return
+            if stop < media.end:
+                self.close_connection = True
+                self.wfile.flush()
+                try:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = handle_call
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeDriveHandler
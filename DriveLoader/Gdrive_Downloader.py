@@ -1,34 +1,73 @@
-import os, time, requests
+import os, time, json, threading, requests, dataclasses
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from functions import *
+from DriveLoader.Transfer_Scheduler import TransferScheduler
+from DriveLoader.Drive_Records import DriveFile, FILE_FIELDS
+from DriveLoader.Http_Session import get_session
+from DriveLoader.Credential_Manager import as_credentials
+from DriveLoader.Download_Manifest import DownloadManifest, prepare_part, part_verified, discard_part
+from DriveLoader.Job_Journal import JobJournal, journal_path
+from DriveLoader.Client_Credentials import API_ROOT
+from DriveLoader.Rate_Limiter import download_limiter
+from DriveLoader.Retry_Policy import RetryPolicy, AimdController
+from DriveLoader.Transfer_Metrics import metrics
+from DriveLoader.Trace_Hooks import tracer, traced
+
+class FileNotDownloadable(Exception):
+    """Drive refused a file for good (permissions, format), retrying will not help."""
 
 class Gdrive_Bulker:
-    def __init__(self, access_token) :
-        self.access_token = access_token
+    def __init__(self, credentials) :
+        self.credentials = as_credentials(credentials)  # refreshes itself, shared by all workers
 
-        self.base_url = 'https://www.googleapis.com/drive/v3'
+        self.base_url = f'{API_ROOT}/drive/v3'
         self.folder_mime_type = 'application/vnd.google-apps.folder'
 
         self.root_folder_id = None  # Set the root folder ID here
 
         self.downloader_path = "Downloads"
         self.max_downloader_count = 3
+        self.max_lister_count = 4  # folders listed in parallel
+        self.page_size = 1000
+
+        # 'threaded' or 'asyncio' (needs aiohttp), same entry points for both
+        self.engine = 'threaded'
+        self.max_async_count = 200  # transfers in flight with the asyncio engine
+
+        # segmented mode for big single files, 0/1 disables it
+        self.segment_count = 0
+        self.segment_threshold = 256 * 1024 * 1024
+
+        self.session = get_session(credentials=self.credentials)
+        self.journal = None  # JobJournal of the running download_folder, if any
+
+        # live concurrency shrinks on 429/rateLimitExceeded and grows back up to max_downloader_count
+        self.download_slots = AimdController(self.max_downloader_count)
+        self.retry_policy = RetryPolicy(controller=self.download_slots)
+        metrics.watch('download', self.download_slots)
+
+    def set_credentials(self, credentials):
+        """Switch account: new credentials and that account's pooled session."""
+        self.credentials = as_credentials(credentials)
+        self.session = get_session(credentials=self.credentials)
 
     def get_headers(self):
-        return {'Authorization': f'Bearer {self.access_token}'}
+        return self.credentials.headers()
 
+    @traced('list folder', 'listing')
     def file_lister(self, folder_id, page_token=None):
         """Retrieve list of files in a Google Drive Folder"""
         url = f'{self.base_url}/files'
         params = {
-            'q': f"'{folder_id}' in parents",
+            'q': f"'{folder_id}' in parents and trashed=false",
             'spaces': 'drive',
-            'fields': 'nextPageToken, files(id, name, mimeType)',
+            'fields': f'nextPageToken, files({FILE_FIELDS})',
+            'pageSize': self.page_size,
             'pageToken': page_token
         }
 
-        response = requests.get(url, headers=self.get_headers(), params=params)
+        response = self.retry_policy.request(self.session, 'GET', url, headers=self.get_headers(), params=params)
         response.raise_for_status()
 
         file_lister_json = response.json()
@@ -38,21 +77,32 @@ class Gdrive_Bulker:
 
         return file_lister_json
     
-    def file_size_finder(self, file_id):
-        #fetch the file metadata to get the file size
-        metadata_url = f'{self.base_url}/files/{file_id}?fields=size'
-        metadata_response = requests.get(metadata_url, headers=self.get_headers())
+    @traced('file metadata', 'metadata')
+    def file_metadata(self, file_id):
+        """Fetch everything the downloader needs about a file in one request."""
+        metadata_url = f'{self.base_url}/files/{file_id}'
+        metadata_response = self.retry_policy.request(self.session, 'GET', metadata_url, headers=self.get_headers(), params={'fields': FILE_FIELDS})
         metadata_response.raise_for_status()
-        total_size = int(metadata_response.json().get('size', 0))
-        return total_size
+        return DriveFile.from_json(metadata_response.json())
 
-    def file_downloader(self, file_id, file_name, folder_path, min_speed=1024, timeout=10, max_retries=5):
-        """Download a file from Google Drive with retry logic automation."""
+    @traced('download file', 'transfer')
+    def file_downloader(self, drive_file, folder_path, min_speed=1024, timeout=10, max_retries=5, segmented=False):
+        """Download a file from Google Drive with retry logic automation.
 
-        file_name = sanitizer_names(file_name)
+        Bytes go to a `<name>.part` sidecar which is resumed with a Range request on
+        retry or on the next run, as long as the file has not changed on Drive since,
+        and only renamed into place once its size and md5 check out.
+        With `segmented=True`, files above `segment_threshold` are fetched in parallel ranges.
+        Returns True once the file is in place; raises FileNotDownloadable when Drive refuses it.
+        """
+
+        file_id = drive_file.id
+        file_name = sanitizer_names(drive_file.name)
         file_path = os.path.join(folder_path, file_name)
+        part_path = file_path + '.part'
 
-        total_size = self.file_size_finder(file_id)
+        # size comes from the listing, no extra metadata request per file
+        total_size = drive_file.size or 0
         #if the file exists, check if its size matches the expected size
         if os.path.exists(file_path):
             existing_size =  os.path.getsize(file_path)
@@ -60,62 +110,245 @@ class Gdrive_Bulker:
                 print('\n\n==========================================================')
                 print(f'File  already downloaded and verified: {file_path}')
                 print('==========================================================')
-                return
+                return True
             else:
                 print(f'\nFile Size Mismatch for {file_path}. Deleting and redownloading....')
                 os.remove(file_path)
 
 
         os.makedirs(folder_path, exist_ok=True)
+        prepare_part(drive_file, part_path)
+
+        # an existing segment map means the .part is preallocated, never resume it sequentially
+        if os.path.exists(part_path + '.segments') or (
+                segmented and self.segment_count > 1 and total_size >= self.segment_threshold):
+            return self.segmented_downloader(drive_file, file_path, max_retries)
         
         retry_count = 0  # Counting failed downloads
         
         while retry_count < max_retries:
             try:
-                request_url = f'{self.base_url}/files/{file_id}?alt=media'
-                response = requests.get(request_url, headers=self.get_headers(), stream=True)
-                response.raise_for_status()
-                #total_size = int(response.headers.get('Content-Length', 0))
-
-                start_time = time.time()
-                bytes_written = 0
-                chunk_size = 0
-
-                with open(file_path, 'wb') as out_file, tqdm(total=total_size, unit="B", unit_scale=True, desc=os.path.basename(file_path)) as pbar:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            out_file.write(chunk)
-                            pbar.update(len(chunk))
-                            bytes_written += len(chunk)
-                            chunk_size += len(chunk)
-                            
-                            # Chunk download speed
-                            elapsed_time = time.time() - start_time
-                            if elapsed_time > timeout:
-                                current_speed = chunk_size / elapsed_time
-                                if current_speed < min_speed:
-                                    print(f"\nDownload speed too low ({current_speed:.2f} B/s). Retrying... (Attempt {retry_count + 1}/{max_retries})")
-                                    break
-                                chunk_size = 0
-                                start_time = time.time()
-                # If download completes successfully
-                clear_console()
-                print("\n\n==========================================")
-                print(f"Downloaded: {file_path}")
-                print("==========================================")
-                return
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                if total_size and offset > total_size:
+                    # leftover from a different revision of the file
+                    os.remove(part_path)
+                    offset = 0
+
+                if not (total_size and offset == total_size):
+                    with self.download_slots:
+                        self.fetch_to_part(file_id, part_path, offset, total_size, min_speed, timeout)
+                    self.retry_policy.success()
+
+                downloaded_size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                if total_size and downloaded_size != total_size:
+                    print(f"\nIncomplete download of {file_name} ({downloaded_size}/{total_size} bytes). Resuming... (Attempt {retry_count + 1}/{max_retries})")
+                elif not self.verify_part(drive_file, part_path):
+                    print(f"\nChecksum mismatch for {file_name}. Downloading it again... (Attempt {retry_count + 1}/{max_retries})")
+                    os.remove(part_path)
+                else:
+                    # If download completes successfully
+                    os.replace(part_path, file_path)
+                    os.remove(part_path + '.meta')
+                    clear_console()
+                    print("\n\n==========================================")
+                    print(f"Downloaded: {file_path}")
+                    print("==========================================")
+                    return True
             except requests.RequestException as e:
                 print(f"\nError occurred while downloading {file_name}: {e}")
+                # backs off (honouring Retry-After) and tells the concurrency controller about throttling
+                if not self.retry_policy.backoff(e, retry_count):
+                    discard_part(part_path)
+                    raise FileNotDownloadable(f"{file_name}: {e}") from e
             
             retry_count += 1
-            if os.path.exists(file_path):
-                os.remove(file_path)
             print("Retrying...\n")
         
-        print(f"Failed to download {file_name} after {max_retries} attempts.")
+        print(f"Failed to download {file_name} after {min(retry_count + 1, max_retries)} attempts. Partial data kept in {part_path}")
+        return False
+
+    @traced('verify md5', 'disk')
+    def verify_part(self, drive_file, part_path):
+        return part_verified(drive_file, part_path)
+
+    def fetch_to_part(self, file_id, part_path, offset, total_size, min_speed=1024, timeout=10):
+        """Append the file's bytes from `offset` onwards to `part_path`, stopping early if the speed drops too low."""
+        headers = self.get_headers()
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+
+        request_url = f'{self.base_url}/files/{file_id}?alt=media'
+        request_time = time.monotonic()
+        response = self.session.get(request_url, headers=headers, stream=True)
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            # server ignored the range, start over
+            offset = 0
+
+        start_time = time.time()
+        chunk_size = 0
+
+        with open(part_path, 'ab' if offset else 'wb') as out_file, tqdm(total=total_size, initial=offset, unit="B", unit_scale=True, desc=os.path.basename(part_path)) as pbar, \
+                tracer.profiled():
+            for chunk in tracer.iterate(response.iter_content(chunk_size=8192), 'read chunk'):
+                if chunk:
+                    if request_time is not None:
+                        metrics.first_byte(time.monotonic() - request_time)
+                        request_time = None
+                    with tracer.span('write chunk', 'disk'):
+                        out_file.write(chunk)
+                    with tracer.span('progress bar', 'ui'):
+                        pbar.update(len(chunk))
+                    metrics.add_bytes('download', len(chunk))
+                    chunk_size += len(chunk)
+                    # time spent held back by the bandwidth cap is not slowness
+                    start_time += download_limiter.consume(len(chunk))
+                    
+                    # Chunk download speed
+                    elapsed_time = time.time() - start_time
+                    if elapsed_time > timeout:
+                        current_speed = chunk_size / elapsed_time
+                        if current_speed < min_speed:
+                            print(f"\nDownload speed too low ({current_speed:.2f} B/s).")
+                            break
+                        chunk_size = 0
+                        start_time = time.time()
+        response.close()
     
+    def segmented_downloader(self, drive_file, file_path, max_retries=5):
+        """Fetch one large file as concurrent byte ranges written at their offsets in a preallocated .part file."""
+        total_size = drive_file.size
+        file_name = os.path.basename(file_path)
+        part_path = file_path + '.part'
+        state_path = part_path + '.segments'
+
+        segments = None
+        if os.path.exists(state_path) and os.path.exists(part_path):
+            with open(state_path, 'r') as state_file:
+                state = json.load(state_file)
+            if state.get('size') == total_size:
+                segments = state['segments']
+                print(f"Resuming {file_name} from {len(segments)} saved segments.")
+        if segments is None:
+            # plan fresh segments: [start, end, bytes already written]
+            segment_count = max(2, self.segment_count)
+            segment_size = -(-total_size // segment_count)
+            segments = [[start, min(start + segment_size, total_size) - 1, 0] for start in range(0, total_size, segment_size)]
+            with open(part_path, 'wb') as part_file:
+                part_file.truncate(total_size)
+
+        state_lock = threading.Lock()
+        refused = []  # fatal errors of any segment
+
+        def save_state():
+            with open(state_path, 'w') as state_file:
+                json.dump({'size': total_size, 'segments': segments}, state_file)
+
+        save_state()
+        done_bytes = sum(segment[2] for segment in segments)
+
+        with tqdm(total=total_size, initial=done_bytes, unit="B", unit_scale=True, desc=file_name) as pbar:
+            def fetch_segment(segment):
+                for attempt in range(max_retries):
+                    start, end, written = segment
+                    if start + written > end:
+                        return
+                    try:
+                        headers = self.get_headers()
+                        headers['Range'] = f'bytes={start + written}-{end}'
+                        request_url = f'{self.base_url}/files/{drive_file.id}?alt=media'
+                        request_time = time.monotonic()
+                        response = self.session.get(request_url, headers=headers, stream=True)
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            raise requests.RequestException("Server does not support range requests")
+
+                        with open(part_path, 'r+b') as part_file, tracer.profiled():
+                            part_file.seek(start + written)
+                            unsaved = 0
+                            for chunk in tracer.iterate(response.iter_content(chunk_size=64 * 1024), 'read chunk'):
+                                if chunk:
+                                    if request_time is not None:
+                                        metrics.first_byte(time.monotonic() - request_time)
+                                        request_time = None
+                                    with tracer.span('write chunk', 'disk'):
+                                        part_file.write(chunk)
+                                    with tracer.span('progress bar', 'ui'):
+                                        pbar.update(len(chunk))
+                                    metrics.add_bytes('download', len(chunk))
+                                    download_limiter.consume(len(chunk))
+                                    unsaved += len(chunk)
+                                    # record progress only for bytes already handed to the OS
+                                    if unsaved >= 4 * 1024 * 1024:
+                                        part_file.flush()
+                                        with state_lock, tracer.span('save segments', 'disk'):
+                                            segment[2] += unsaved
+                                            save_state()
+                                        unsaved = 0
+                            part_file.flush()
+                            with state_lock:
+                                segment[2] += unsaved
+                                save_state()
+                        response.close()
+                    except requests.RequestException as e:
+                        print(f"\nSegment {start}-{end} of {file_name} failed: {e}. Retrying... (Attempt {attempt + 1}/{max_retries})")
+                        if not self.retry_policy.backoff(e, attempt):
+                            refused.append(e)
+                            return
+
+            with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                list(executor.map(fetch_segment, segments))
+
+        if refused:
+            discard_part(part_path)
+            raise FileNotDownloadable(f"{file_name}: {refused[0]}") from refused[0]
+        missing = sum(end - start + 1 - written for start, end, written in segments)
+        if missing:
+            print(f"Failed to download {file_name}: {missing} bytes missing. Progress kept in {state_path}")
+            return False
+        if not self.verify_part(drive_file, part_path):
+            print(f"Failed to download {file_name}: checksum mismatch, partial data discarded.")
+            discard_part(part_path)
+            return False
+
+        os.replace(part_path, file_path)
+        os.remove(state_path)
+        os.remove(part_path + '.meta')
+        clear_console()
+        print("\n\n==========================================")
+        print(f"Downloaded: {file_path} ({len(segments)} segments)")
+        print("==========================================")
+        return True
+
+    def tracked_downloader(self, drive_file, folder_path, manifest, **kwargs):
+        """Run file_downloader and record the finished file in the manifest (and job journal)."""
+        journal = self.journal
+        if journal is not None:
+            journal.started(drive_file.id)
+        try:
+            ok = self.file_downloader(drive_file, folder_path, **kwargs)
+        except FileNotDownloadable as e:
+            print(f"\nGiving up on {e}")
+            metrics.file_finished(False)
+            if journal is not None:
+                # terminal: a rerun would only be refused again
+                journal.failure(drive_file.id, e, permanent=True)
+            return False
+        metrics.file_finished(ok)
+        if ok:
+            manifest.mark(drive_file, os.path.join(folder_path, sanitizer_names(drive_file.name)))
+            if journal is not None:
+                journal.finished(drive_file.id)
+        elif journal is not None:
+            journal.failure(drive_file.id)
+        return ok
+
     def download_folder(self, folder_id=None, folder_path=None):
-        """Recursively process Google Drive folders and download files."""
+        """Crawl a Google Drive folder tree breadth-first and download files as they are discovered.
+
+        Returns True when every folder was listed and every file downloaded or refused
+        for good. A killed run is resumed from its journal, then the tree is listed
+        again so files added in the meantime are picked up too."""
         
         #depricated will be patched soon from main.py
         if folder_id is None:
@@ -124,53 +357,124 @@ class Gdrive_Bulker:
             folder_path = self.downloader_path
         ########
 
+        if self.engine == 'asyncio':
+            from DriveLoader.Async_Downloader import AsyncDriveEngine
+            return AsyncDriveEngine(self).download_folder(folder_id, folder_path)
+
+        self.download_slots.set_maximum(self.max_downloader_count)
+
+        # the journal of a killed run holds its plan, so a restart skips straight to the unfinished work
+        journal = self.journal = JobJournal(journal_path('download', folder_id, os.path.abspath(folder_path)))
+        completed = replayed = False
+        try:
+            # listers are producers, downloaders consume; both run at the same time so the
+            # first files start downloading while the rest of the tree is still being listed.
+            # one download pool for the whole tree keeps max_downloader_count the real global concurrency
+            with DownloadManifest(folder_path) as manifest, \
+                 TransferScheduler(worker_count=self.max_downloader_count, name='download') as downloads, \
+                 TransferScheduler(worker_count=self.max_lister_count, queue_size=0, name='listing') as listings:
+                if journal.resumed:
+                    self.resume_journal(journal, listings, downloads, manifest)
+                else:
+                    journal.plan(folder_id, {'type': 'folder', 'path': folder_path})
+                    listings.submit(self.queue_folder, folder_id, folder_path, listings, downloads, manifest)
+                listings.join()
+                downloads.join()
+            completed = not journal.unfinished('folder') and not journal.unfinished('file')
+            replayed = journal.resumed
+        finally:
+            self.journal = None
+            # failed items stay in the journal and are retried by the next run; a replayed
+            # journal only knew the old tree, the fresh listing below takes over from it
+            journal.close(remove=completed or replayed)
+        if replayed:
+            print("Journal replayed, listing the tree again for files added since...")
+            return self.download_folder(folder_id, folder_path)
+        return completed
+
+    def resume_journal(self, journal, listings, downloads, manifest):
+        """Queue only what a previous run of this job left unfinished."""
+        folders = journal.unfinished('folder')
+        files = journal.unfinished('file')
+        print(f"Resuming job: {len(journal.done)} files already done, {len(files)} left, {len(folders)} folders still to list")
+        for folder_id, item in folders:
+            listings.submit(self.queue_folder, folder_id, item['path'], listings, downloads, manifest)
+        metrics.file_queued(len(files))
+        for file_id, item in files:
+            downloads.submit(self.tracked_downloader, DriveFile(**item['file']), item['path'], manifest)
+
+    def queue_folder(self, folder_id, folder_path, listings, downloads, manifest):
+        """List one folder, queue its subfolders for listing and its files for download."""
         os.makedirs(folder_path, exist_ok=True)
+        manifest.mark_folder(folder_id, folder_path)
+        journal = self.journal
         page_token = None
 
         while True:
             response = self.file_lister(folder_id, page_token)
-            file_download_tasks = []
-
-            # using threadpoolexecutor to manage concurrent downloads
-            with ThreadPoolExecutor(max_workers=self.max_downloader_count) as executor:
-                for file in response.get('files', []):
-                    file_id = file['id']
-                    file_name = file['name']
-                    mime_type = file['mimeType']
-
-                    if mime_type == self.folder_mime_type:
-                        # Searching inside the folders
-                        subfolder_path = os.path.join(folder_path, sanitizer_names(file_name))
-                        self.download_folder(file_id, subfolder_path)
-                    else:
-                        # Start downloading the files if found
-                        #self.file_downloader(file_id, file_name, folder_path)
-                        future = executor.submit(self.file_downloader, file_id, file_name, folder_path)
-                        file_download_tasks.append(future)
-                # wait for all tasks to complete
-                for future in as_completed(file_download_tasks):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        print(f"An error occurred during download: {e}")
+            drive_files = [DriveFile.from_json(file) for file in response.get('files', [])]
+            # one index query per page decides which files are already done
+            with tracer.span('manifest lookup', 'disk', files=len(drive_files)):
+                known = manifest.lookup_many(drive_file.id for drive_file in drive_files)
+            skipped = native = 0
+
+            for drive_file in drive_files:
+                if drive_file.google_native:
+                    # Docs, Sheets, shortcuts... have no bytes to download
+                    native += 1
+                elif drive_file.mime_type == self.folder_mime_type:
+                    # sibling folders get listed in parallel by other listers
+                    subfolder_path = os.path.join(folder_path, sanitizer_names(drive_file.name))
+                    # items the journal already planned are queued by resume_journal instead
+                    if journal is None or journal.plan(drive_file.id, {'type': 'folder', 'path': subfolder_path}):
+                        listings.submit(self.queue_folder, drive_file.id, subfolder_path, listings, downloads, manifest)
+                elif manifest.is_complete(drive_file, os.path.join(folder_path, sanitizer_names(drive_file.name)), known.get(drive_file.id)):
+                    skipped += 1
+                elif journal is None or journal.plan(drive_file.id, {'type': 'file', 'file': dataclasses.asdict(drive_file), 'path': folder_path}):
+                    # blocks while the download queue is full
+                    metrics.file_queued()
+                    downloads.submit(self.tracked_downloader, drive_file, folder_path, manifest)
+
+            if skipped:
+                print(f'Skipped {skipped} files already in the manifest of {folder_path}')
+            if native:
+                print(f'Skipped {native} Google Docs/Sheets/shortcuts in {folder_path}, they cannot be downloaded as files')
             
             page_token = response.get('nextPageToken')
             
             if not page_token:
                 break
+
+        if journal is not None:
+            journal.folder_listed(folder_id)
     
     def get_status(self):
-        pass
+        """Snapshot of the transfer metrics plus this downloader's live concurrency.
+
+        The metrics are process-wide: bytes/sec, files queued/done/failed, retries by
+        cause, 429s, API latency per endpoint and time to first byte."""
+        status = metrics.snapshot()
+        status['engine'] = self.engine
+        status['concurrency'] = {
+            'active': self.download_slots.active,
+            'limit': self.download_slots.limit,
+            'maximum': self.download_slots.maximum,
+        }
+        return status
 
     def download_single_file(self, file_id=None):
         '''downlod a single file froma google drive link.'''
+        if file_id == None:
+            file_id = self.root_folder_id
+        file_name = file_id  # until the real name is known
         try:
-            if file_id == None:
-                file_id = self.root_folder_id
-            metadata_url = f'{self.base_url}/files/{file_id}?fields=name'
-            response = requests.get(metadata_url, headers=self.get_headers())
-            response.raise_for_status()
-            file_name = response.json()['name']
-            self.file_downloader(file_id, file_name, self.downloader_path)
+            if self.engine == 'asyncio':
+                from DriveLoader.Async_Downloader import AsyncDriveEngine
+                return AsyncDriveEngine(self).download_single_file(file_id, self.downloader_path)
+            drive_file = self.file_metadata(file_id)
+            file_name = drive_file.name
+            with DownloadManifest(self.downloader_path) as manifest:
+                metrics.file_queued()
+                self.tracked_downloader(drive_file, self.downloader_path, manifest, segmented=True)
         except Exception as e:
             print(f'Failed to download file {file_name}: {e}')
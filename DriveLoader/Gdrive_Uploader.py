@@ -1,66 +1,231 @@
 import mimetypes
 import os
 import time
-from googleapiclient.http import MediaFileUpload
+import threading
+import queue
+import json
+import uuid
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import requests
-from functions import sanitizer_names
+from functions import sanitizer_names, escape_query_value
+from DriveLoader.Http_Session import get_session
+from DriveLoader.Credential_Manager import as_credentials
+from DriveLoader.Drive_Batch import DriveBatch, MAX_BATCH_SIZE
+from DriveLoader.Transfer_Scheduler import TransferScheduler
+from DriveLoader.Upload_Sessions import UploadSessionExpired, get_upload_sessions
+from DriveLoader.Job_Journal import JobJournal, journal_path
+from DriveLoader.Client_Credentials import API_ROOT
+from DriveLoader.Local_Hasher import get_hasher
+from DriveLoader.Rate_Limiter import upload_limiter
+from DriveLoader.Retry_Policy import RetryPolicy, AimdController, classify
+from DriveLoader.Transfer_Metrics import metrics
+from DriveLoader.Trace_Hooks import tracer, traced
+
+CHUNK_ALIGNMENT = 256 * 1024  # resumable chunks must be multiples of this
+
+class RemoteFolderCache:
+    """Listing of each destination folder, fetched once and kept current as uploads finish."""
+    def __init__(self, uploader):
+        self.uploader = uploader
+        self.folders = {}  # folder_id -> {name: [file dicts]}
+        self.lock = threading.Lock()
+        self.folder_locks = {}
+
+    def _folder(self, folder_id):
+        with self.lock:
+            if folder_id in self.folders:
+                return self.folders[folder_id]
+            folder_lock = self.folder_locks.setdefault(folder_id, threading.Lock())
+        # one listing per folder even when many workers ask at once
+        with folder_lock:
+            with self.lock:
+                if folder_id in self.folders:
+                    return self.folders[folder_id]
+            entries = {}
+            for child in self.uploader.list_folder_children(folder_id):
+                entries.setdefault(child['name'], []).append(child)
+            with self.lock:
+                self.folders[folder_id] = entries
+            return entries
+
+    def lookup(self, folder_id, name):
+        """Same shape as list_files(name, folder_id)."""
+        entries = self._folder(folder_id)
+        with self.lock:
+            return list(entries.get(name, []))
+
+    def add(self, folder_id, drive_file):
+        entries = self._folder(folder_id)
+        with self.lock:
+            entries.setdefault(drive_file['name'], []).insert(0, drive_file)
+
+    def remove(self, folder_id, name):
+        entries = self._folder(folder_id)
+        with self.lock:
+            entries.pop(name, None)
 
 class GdriveUploader:
-    def __init__(self, access_token, max_retries=5, min_chunk_size=512 * 1024, max_chunk_size=12 * 1024 * 1024):
-        self.access_token = access_token
-        self.base_url = 'https://www.googleapis.com/upload/drive/v3/files'
+    def __init__(self, credentials, max_retries=5, min_chunk_size=512 * 1024, max_chunk_size=12 * 1024 * 1024):
+        self.credentials = as_credentials(credentials)  # refreshes itself, shared by all workers
+        self.base_url = f'{API_ROOT}/upload/drive/v3/files'
+        self.files_url = f'{API_ROOT}/drive/v3/files'
         self.folder_mime_type = 'application/vnd.google-apps.folder'
         self.max_retries = max_retries
-        self.min_chunk_size = min_chunk_size  # Minimum chunk size (512 KB)
-        self.max_chunk_size = max_chunk_size  # Maximum chunk size (12 MB)
+        self.min_chunk_size = self._aligned_chunk_size(min_chunk_size)  # Minimum chunk size (512 KB)
+        self.max_chunk_size = self._aligned_chunk_size(max_chunk_size)  # Maximum chunk size (12 MB)
+        self.buffer_pool = queue.LifoQueue()  # reusable max_chunk_size buffers for _resumable_upload
+        # both shared by every uploader of the process, sharded accounts included
+        self.upload_sessions = get_upload_sessions()
+        self.hasher = get_hasher()  # cached md5s for content comparison
         self.root_filefolder_id = None
         self.max_uploader_count = 2
+        self.multipart_threshold = 5 * 1024 * 1024  # smaller files go up in a single multipart request
+        self.max_lister_count = 4  # parallel listings/batches while building the remote tree
+        self.folder_cache = None  # RemoteFolderCache while upload_folder runs
+        self.session = get_session(credentials=self.credentials)
+
+        # live concurrency shrinks on 429/rateLimitExceeded and grows back up to max_uploader_count
+        self.upload_slots = AimdController(self.max_uploader_count)
+        self.retry_policy = RetryPolicy(max_retries=max_retries, controller=self.upload_slots)
+        metrics.watch('upload', self.upload_slots)
     
-    def get_headers(self):
-        return {'Authorization': f'Bearer {self.access_token}'}
+    def set_credentials(self, credentials):
+        """Switch account: new credentials and that account's pooled session."""
+        self.credentials = as_credentials(credentials)
+        self.session = get_session(credentials=self.credentials)
 
-    def _resumable_upload(self, upload_url, file_path):
-        """Optimized file upload with dynamic chunk size adjustment based on speed."""
+    def get_headers(self):
+        return self.credentials.headers()
+
+    def _aligned_chunk_size(self, size):
+        """Round down to a multiple of 256 KiB, as the resumable protocol requires for non-final chunks."""
+        return max(CHUNK_ALIGNMENT, size - size % CHUNK_ALIGNMENT)
+
+    def _take_buffer(self):
+        try:
+            return self.buffer_pool.get_nowait()
+        except queue.Empty:
+            return bytearray(self.max_chunk_size)
+
+    def _committed_offset(self, upload_url, file_size):
+        """Ask the server how much of a resumable session it has committed.
+
+        Returns (offset, file_resource); file_resource is set when the upload is already complete."""
+        headers = self.get_headers()
+        headers['Content-Range'] = f'bytes */{file_size}'
+        response = self.session.put(upload_url, headers=headers, data=b'')
+        if response.status_code in (200, 201):
+            return file_size, response.json()
+        if response.status_code in (404, 410):
+            raise UploadSessionExpired(f"Upload session expired: HTTP {response.status_code}")
+        if response.status_code != 308:
+            raise requests.HTTPError(f"Unexpected response: {response.status_code}", response=response)
+        return self._range_end(response), None
+
+    @staticmethod
+    def _range_end(response):
+        """Bytes committed according to a 308 response's Range header (absent means none)."""
+        committed = response.headers.get('Range')
+        return int(committed.rsplit('-', 1)[1]) + 1 if committed else 0
+
+    def _resumable_upload(self, upload_url, file_path, resume=False):
+        """Optimized file upload with dynamic chunk size adjustment based on speed.
+
+        Two pooled buffers are used in turn: the next chunk is read from disk on a
+        helper thread while the current one is being PUT, and chunks are sent as
+        memoryview slices of those buffers without copying. Retries and resumed
+        sessions start from the offset the server reports as committed.
+        """
         file_size = os.path.getsize(file_path)
         current_chunk_size = self.min_chunk_size
 
         retries = 0
         upload_successful = False
-
-        # Create a persistent session for network efficiency
-        session = requests.Session()
-
-        with open(file_path, 'rb') as f, tqdm(total=file_size, unit='B', unit_scale=True, desc=os.path.basename(file_path)) as pbar:
+        uploaded_file = None  # file resource returned by the final chunk
+
+        # shared pooled session, keeps the connection alive across files
+        session = self.session
+        buffers = [self._take_buffer(), self._take_buffer()]
+
+        def read_chunk(buffer, offset, size):
+            with tracer.span('read chunk', 'disk', size=size):
+                f.seek(offset)
+                view = memoryview(buffer)[:size]
+                filled = 0
+                while filled < size:
+                    count = f.readinto(view[filled:])
+                    if not count:
+                        break  # End of file
+                    filled += count
+                return view[:filled]
+
+        with self.upload_slots, open(file_path, 'rb') as f, ThreadPoolExecutor(max_workers=1) as reader, \
+                tqdm(total=file_size, unit='B', unit_scale=True, desc=os.path.basename(file_path)) as pbar, tracer.profiled():
             bytes_uploaded = 0
 
             while not upload_successful and retries < self.max_retries:
+                next_read = None
                 try:
-                    f.seek(bytes_uploaded)
                     start_time = time.time()
 
+                    if retries or resume:
+                        # a retry or a reused session: continue from what the server really has
+                        bytes_uploaded, uploaded_file = self._committed_offset(upload_url, file_size)
+                        pbar.reset()
+                        pbar.update(bytes_uploaded)
+
+                    if file_size == 0 and uploaded_file is None:
+                        # empty files still need one request to finalize the session
+                        headers = self.get_headers()
+                        headers['Content-Range'] = 'bytes */0'
+                        response = session.put(upload_url, headers=headers, data=b'')
+                        if response.status_code not in (200, 201):
+                            raise requests.HTTPError(f"Unexpected response: {response.status_code}", response=response)
+                        uploaded_file = response.json()
+
+                    turn = 0
+                    if bytes_uploaded < file_size:
+                        next_read = reader.submit(read_chunk, buffers[turn], bytes_uploaded, current_chunk_size)
+
                     while bytes_uploaded < file_size:
-                        chunk = f.read(current_chunk_size)
+                        # time spent here is disk reads the prefetch could not hide
+                        with tracer.span('wait for read', 'disk'):
+                            chunk = next_read.result()
+                        next_read = None
                         if not chunk:
                             break  # End of file
 
+                        # start filling the other buffer while this chunk is in flight
+                        next_offset = bytes_uploaded + len(chunk)
+                        turn ^= 1
+                        if next_offset < file_size:
+                            next_read = reader.submit(read_chunk, buffers[turn], next_offset, current_chunk_size)
+
                         headers = {
-                            'Authorization': f'Bearer {self.access_token}',
+                            **self.get_headers(),
                             'Content-Length': str(len(chunk)),
-                            'Content-Range': f'bytes {bytes_uploaded}-{bytes_uploaded + len(chunk) - 1}/{file_size}'
+                            'Content-Range': f'bytes {bytes_uploaded}-{next_offset - 1}/{file_size}'
                         }
 
-                        # Upload chunk
+                        # Upload chunk, after waiting for bandwidth (that wait does not count towards speed)
+                        start_time += upload_limiter.consume(len(chunk))
                         response = session.put(upload_url, headers=headers, data=chunk)
                         if response.status_code not in (200, 201, 308):
-                            raise requests.RequestException(f"Unexpected response: {response.status_code}")
+                            raise requests.HTTPError(f"Unexpected response: {response.status_code}", response=response)
+                        if response.status_code in (200, 201):
+                            uploaded_file = response.json()
+                        elif self._range_end(response) != next_offset:
+                            # server kept less than we sent, the next attempt asks it where to resume
+                            raise requests.RequestException(f"Server committed {self._range_end(response)} of {next_offset} bytes")
 
                         # Update progress
-                        bytes_uploaded += len(chunk)
-                        pbar.update(len(chunk))
+                        bytes_uploaded = next_offset
+                        with tracer.span('progress bar', 'ui'):
+                            pbar.update(len(chunk))
+                        metrics.add_bytes('upload', len(chunk))
 
-                        # Measure time taken and adjust chunk size
+                        # Measure time taken and adjust chunk size (applies from the chunk after the prefetched one)
                         elapsed_time = time.time() - start_time
                         if elapsed_time > 0:
                             speed = len(chunk) / elapsed_time  # bytes per second
@@ -70,36 +235,192 @@ class GdriveUploader:
                                 current_chunk_size = min(self.max_chunk_size, current_chunk_size * 2)
                             elif speed < 190 * 1024 and current_chunk_size > self.min_chunk_size:  # < 190 KB/s
                                 current_chunk_size = max(self.min_chunk_size, current_chunk_size // 2)
+                            current_chunk_size = self._aligned_chunk_size(current_chunk_size)
 
                         start_time = time.time()  # Reset start time for next chunk
 
                     upload_successful = True
+                    self.retry_policy.success()
 
                     print(f"\nFile '{os.path.basename(file_path)}' uploaded successfully!\n")
 
                 except requests.RequestException as e:
+                    if next_read is not None:
+                        next_read.result()  # the reader must be idle before the next seek
+                    print(f"Upload error: {e}. Retrying... ({retries + 1}/{self.max_retries})")
+                    # jittered backoff, honours Retry-After and reports throttling
+                    if not self.retry_policy.backoff(e, retries):
+                        break
                     retries += 1
-                    print(f"Upload error: {e}. Retrying... ({retries}/{self.max_retries})")
-                    time.sleep(min(2 ** retries, 60))  # Exponential backoff, capped at 60 seconds
+
+        for buffer in buffers:
+            self.buffer_pool.put(buffer)
 
         if not upload_successful:
             raise Exception(f"Failed to upload file after {self.max_retries} attempts")
-
-
+        return uploaded_file
+
+
+    def _multipart_upload(self, file_path, file_metadata, mime_type=None):
+        """Upload a small file with uploadType=multipart: metadata and content in one request."""
+        with open(file_path, 'rb') as f, tracer.span('read file', 'disk'):
+            content = f.read()
+
+        boundary = f'upload_{uuid.uuid4().hex}'
+        body = b''.join([
+            f'--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n'.encode(),
+            json.dumps(file_metadata).encode(),
+            f'\r\n--{boundary}\r\nContent-Type: {mime_type or "application/octet-stream"}\r\n\r\n'.encode(),
+            content,
+            f'\r\n--{boundary}--\r\n'.encode(),
+        ])
+        headers = self.get_headers()
+        headers['Content-Type'] = f'multipart/related; boundary={boundary}'
+        upload_url = f'{self.base_url}?uploadType=multipart&fields=id,name,size,md5Checksum,mimeType'
+
+        for retries in range(self.max_retries):
+            try:
+                with self.upload_slots:
+                    upload_limiter.consume(len(body))
+                    response = self.session.post(upload_url, headers=headers, data=body)
+                    response.raise_for_status()
+                self.retry_policy.success()
+                metrics.add_bytes('upload', len(content))
+                print(f"\nFile '{os.path.basename(file_path)}' uploaded successfully!\n")
+                return response.json()
+            except requests.RequestException as e:
+                print(f"Upload error: {e}. Retrying... ({retries + 1}/{self.max_retries})")
+                if not self.retry_policy.backoff(e, retries):
+                    break
+                # a lost response is not a lost upload: only throttled requests surely created nothing
+                if classify(e) != 'rate_limit':
+                    uploaded_file = self.find_uploaded(file_path, file_metadata, len(content))
+                    if uploaded_file is not None:
+                        print(f"\nFile '{os.path.basename(file_path)}' was uploaded by the failed attempt.\n")
+                        return uploaded_file
+        raise Exception(f"Failed to upload file after {self.max_retries} attempts")
+
+    def find_uploaded(self, file_path, file_metadata, file_size):
+        '''the Drive file an upload attempt may have created: same name, parent, size and md5.'''
+        for existing in self.list_files(file_metadata['name'], file_metadata['parents'][0]):
+            if int(existing.get('size', -1)) == file_size and existing.get('md5Checksum') == self.hasher.md5(file_path):
+                return existing
+        return None
+
+    @traced('find file', 'metadata')
     def list_files(self, name, parent_folder_id='root'):
         '''heler method to list file/folders by name within a parent folder.'''
-        url = f"https://www.googleapis.com/drive/v3/files?q=name='{name}' and '{parent_folder_id}' in parents and trashed=false&fields=files(kind,id,name,size,mimeType)"
-        response = requests.get(url, headers=self.get_headers())
-        response.raise_for_status()
+        url = self.files_url
+        params = {
+            'q': f"name='{escape_query_value(name)}' and '{parent_folder_id}' in parents and trashed=false",
+            'fields': 'files(kind,id,name,size,md5Checksum,mimeType)'
+        }
+        response = self.retry_policy.request(self.session, 'GET', url, headers=self.get_headers(), params=params)
         return response.json().get('files', [])
     
     def delete_file(self, file_id):
         '''delete a file from google drive by id.'''
-        url = f'https://www.googleapis.com/drive/v3/files/{file_id}'
-        response = requests.delete(url, headers=self.get_headers())
-        response.raise_for_status()
+        url = f'{self.files_url}/{file_id}'
+        self.retry_policy.request(self.session, 'DELETE', url, headers=self.get_headers())
         print(f"deleted file with id: {file_id}")
 
+    def delete_files(self, file_ids):
+        '''delete many files/folders with batched requests, returns the ids that could not be deleted.'''
+        batch = DriveBatch(self.session, self.get_headers)
+        for file_id in file_ids:
+            batch.add('DELETE', f'/drive/v3/files/{file_id}')
+        failed = [file_id for file_id, call in zip(file_ids, batch.execute()) if not call.ok]
+        print(f"deleted {len(file_ids) - len(failed)} of {len(file_ids)} files")
+        return failed
+
+    def batch_create_folders(self, folders):
+        '''create (folder_name, parent_folder_id) pairs without any existence check, batched.'''
+        batch = DriveBatch(self.session, self.get_headers)
+        for folder_name, parent_folder_id in folders:
+            batch.add('POST', '/drive/v3/files', params={'fields': 'id'}, body={
+                'name': folder_name,
+                'mimeType': self.folder_mime_type,
+                'parents': [parent_folder_id]}, recover=self.find_created_folder)
+        folder_ids = []
+        for (folder_name, _), call in zip(folders, batch.execute()):
+            if not call.ok:
+                raise Exception(f"Failed to create folder '{folder_name}': HTTP {call.status}")
+            folder_ids.append(call.result['id'])
+            print(f"Created folder: {folder_name} with ID: {call.result['id']}")
+        return folder_ids
+
+    def find_created_folder(self, call):
+        '''recover hook for a failed batched folder create: the folder it may have made anyway.'''
+        name, parent_folder_id = call.body['name'], call.body['parents'][0]
+        for existing in self.list_files(name, parent_folder_id):
+            if existing['mimeType'] == self.folder_mime_type:
+                return existing
+        return None
+
+    def list_folder_children(self, folder_id, folders_only=False):
+        '''list every child of a folder across all pages.'''
+        url = self.files_url
+        query = f"'{folder_id}' in parents and trashed=false"
+        if folders_only:
+            query += f" and mimeType='{self.folder_mime_type}'"
+        params = {'q': query, 'pageSize': 1000, 'fields': 'nextPageToken, files(id, name, size, md5Checksum, mimeType)'}
+        children = []
+        while True:
+            response = self.retry_policy.request(self.session, 'GET', url, headers=self.get_headers(), params=params)
+            listing = response.json()
+            children.extend(listing.get('files', []))
+            if not listing.get('nextPageToken'):
+                return children
+            params['pageToken'] = listing['nextPageToken']
+
+    def folder_snapshot(self, root_folder_id):
+        '''recursively list the remote folder tree once, returns {(parent_id, name): folder_id}.'''
+        snapshot = {}
+        lock = threading.Lock()
+
+        def list_folder(folder_id, listings):
+            for child in self.list_folder_children(folder_id, folders_only=True):
+                with lock:
+                    # first one wins, same as create_folder
+                    if (folder_id, child['name']) in snapshot:
+                        continue
+                    snapshot[(folder_id, child['name'])] = child['id']
+                listings.submit(list_folder, child['id'], listings)
+
+        with TransferScheduler(worker_count=self.max_lister_count, queue_size=0, name='snapshot') as listings:
+            listings.submit(list_folder, root_folder_id, listings)
+            listings.join()
+        return snapshot
+
+    def create_folder_tree(self, folder_path, root_folder_id, snapshot):
+        '''create the missing remote folders for every local subdirectory, level by level.
+
+        Returns {local_dir: folder_id}; folders of one level are created in concurrent batches.'''
+        folder_map = {folder_path: root_folder_id}
+        levels = {}
+        for root, dirs, _ in os.walk(folder_path):
+            for dir_name in dirs:
+                dir_path = os.path.join(root, dir_name)
+                depth = len(os.path.relpath(dir_path, folder_path).split(os.sep))
+                levels.setdefault(depth, []).append(dir_path)
+
+        for depth in sorted(levels):
+            missing = []
+            for dir_path in levels[depth]:
+                key = (folder_map[os.path.dirname(dir_path)], os.path.basename(dir_path))
+                if key in snapshot:
+                    folder_map[dir_path] = snapshot[key]
+                else:
+                    missing.append((dir_path, key))
+
+            chunks = [missing[i:i + MAX_BATCH_SIZE] for i in range(0, len(missing), MAX_BATCH_SIZE)]
+            with ThreadPoolExecutor(max_workers=self.max_lister_count) as executor:
+                created = executor.map(lambda chunk: self.batch_create_folders([(name, parent) for _, (parent, name) in chunk]), chunks)
+                for chunk, folder_ids in zip(chunks, created):
+                    for (dir_path, _), folder_id in zip(chunk, folder_ids):
+                        folder_map[dir_path] = folder_id
+        return folder_map
+
     def create_folder(self, folder_name, parent_folder_id='root'):
         """Create a new folder in Google Drive."""
         existing_folders = self.list_files(folder_name, parent_folder_id)
@@ -114,17 +435,19 @@ class GdriveUploader:
             'parents': [parent_folder_id]
         }
 
-        url = 'https://www.googleapis.com/drive/v3/files'
+        url = self.files_url
 
-        response = requests.post(url, headers=self.get_headers(), json=folder_metadata)
-        response.raise_for_status()
+        response = self.retry_policy.request(self.session, 'POST', url, headers=self.get_headers(), json=folder_metadata)
 
         folder_id = response.json()['id']
         print(f"Created folder: {folder_name} with ID: {folder_id}")
         return folder_id
 
+    @traced('upload file', 'transfer')
     def upload_file(self, file_path, folder_id='root'):
-        """Upload a single file to Google Drive with automatic chunk size adjustment."""
+        """Upload a single file to Google Drive with automatic chunk size adjustment.
+
+        Returns the uploaded file's metadata, or None when an identical file was already there."""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"The file {file_path} does not exist")
 
@@ -132,20 +455,28 @@ class GdriveUploader:
         mime_type, _ = mimetypes.guess_type(file_path)
         file_size = os.path.getsize(file_path)
 
-        #chekc if the file already exists in the folder
-        existing_files = self.list_files(file_name, folder_id)
-        #print(existing_files)
+        #chekc if the file already exists in the folder, from the folder listing when uploading a whole folder
+        if self.folder_cache is not None:
+            existing_files = self.folder_cache.lookup(folder_id, file_name)
+        else:
+            existing_files = self.list_files(file_name, folder_id)
         if existing_files:
             drive_file = existing_files[0] #kind
             drive_file_id = drive_file['id'] #file id
-            drive_file_size = int(drive_file['size']) #file_size
-
-            if drive_file_size == file_size:
-                print(f"File '{file_name}' already exists and matches in size.")
+            drive_file_size = int(drive_file.get('size', -1)) #file_size
+            drive_file_md5 = drive_file.get('md5Checksum') #absent for google docs
+
+            # hash only when the size already matches, the hash is cached per (path, size, mtime)
+            with tracer.span('compare md5', 'disk'):
+                matches = drive_file_size == file_size and (not drive_file_md5 or self.hasher.md5(file_path) == drive_file_md5)
+            if matches:
+                print(f"File '{file_name}' already exists and matches in {'content' if drive_file_md5 else 'size'}.")
                 return
             else:
-                print(f"file '{file_name}' exists but size differs. Deleting and re-uploading.")
+                print(f"file '{file_name}' exists but differs. Deleting and re-uploading.")
                 self.delete_file(drive_file_id)
+                if self.folder_cache is not None:
+                    self.folder_cache.remove(folder_id, file_name)
 
         # File metadata
         file_metadata = {
@@ -154,62 +485,127 @@ class GdriveUploader:
             'parents' : [folder_id]
         }
 
-        # Media upload
-        media = MediaFileUpload(file_path, mimetype=mime_type, resumable=True)
-
-        # Build the request URL
-        upload_url = f'{self.base_url}?uploadType=resumable'
-        response = requests.post(upload_url, headers=self.get_headers(), json=file_metadata)
-        response.raise_for_status()
-
-        # Extract the upload URL from the response
-        upload_url = response.headers['Location']
-
-        # Upload file content
-        self._resumable_upload(upload_url, file_path)
+        if file_size < self.multipart_threshold:
+            # small file: metadata and content in one request, no session round-trip
+            uploaded_file = self._multipart_upload(file_path, file_metadata, mime_type)
+            if self.folder_cache is not None and uploaded_file:
+                self.folder_cache.add(folder_id, uploaded_file)
+            return uploaded_file
+
+        # reuse the session of an earlier, interrupted run of this exact file
+        session_key = self.upload_sessions.key(file_path, folder_id)
+        upload_url = self.upload_sessions.get(session_key)
+        uploaded_file = None
+        if upload_url:
+            print(f"Resuming saved upload session for '{file_name}'")
+            try:
+                uploaded_file = self._resumable_upload(upload_url, file_path, resume=True)
+            except UploadSessionExpired:
+                print(f"Saved upload session for '{file_name}' expired, starting a new one.")
+                self.upload_sessions.close(session_key)
+                upload_url = None
+
+        if not upload_url:
+            # Build the request URL
+            upload_url = f'{self.base_url}?uploadType=resumable&fields=id,name,size,md5Checksum,mimeType'
+            response = self.retry_policy.request(self.session, 'POST', upload_url, headers=self.get_headers(), json=file_metadata)
+
+            # Extract the upload URL from the response and journal it before sending any bytes
+            upload_url = response.headers['Location']
+            self.upload_sessions.open(session_key, upload_url)
+
+            # Upload file content
+            uploaded_file = self._resumable_upload(upload_url, file_path)
+
+        self.upload_sessions.close(session_key)
+        if self.folder_cache is not None and uploaded_file:
+            self.folder_cache.add(folder_id, uploaded_file)
+        return uploaded_file
 
     def upload_folder(self, folder_path, parent_folder_id='root'):
         """Upload an entire folder to Google Drive, preserving the folder structure."""
         # Step 1: Create folder structure on Google Drive and map local paths to Google Drive folder IDs
-        folder_map = {}
-        
-        # Create the main folder on Google Drive
+        folder_path = os.path.normpath(folder_path)
         folder_name = os.path.basename(folder_path)
-        folder_id = self.create_folder(folder_name, parent_folder_id)
-        folder_map[folder_path] = folder_id
-
-        # Walk through the local directory to create folder structure on Google Drive
-        for root, dirs, files in os.walk(folder_path):
-            # Compute the parent folder ID in Google Drive for the current directory
-            parent_folder_id = folder_map.get(root, folder_id)
-            
-            # Create subdirectories on Google Drive and update the folder_map
-            for dir_name in dirs:
-                current_folder_path = os.path.join(root, dir_name)
-                if current_folder_path not in folder_map:
-                    current_folder_id = self.create_folder(dir_name, parent_folder_id)
-                    folder_map[current_folder_path] = current_folder_id
-
-        # Step 2: Upload files into the corresponding Google Drive folders
-        with ThreadPoolExecutor(max_workers=self.max_uploader_count) as executor:
-            #store  futures for asunc exec of  uploader
-            futures = []
-
-            for root, dirs, files in os.walk(folder_path):
-                # Compute the parent folder ID for files in this directory
-                parent_folder_id = folder_map.get(root, folder_id)
-
-                # Upload all files in the current directory
-                for file_name in files:
-                    file_path = os.path.join(root, file_name)
-                    #SUBMIT FILE UPLOAD TASKS TO  BE EXECUTED CONC
-                    futures.append(executor.submit(self.upload_file, file_path, parent_folder_id))
+        # a killed run left its remote tree and finished files in the journal, reuse both
+        journal = JobJournal(journal_path('upload', os.path.abspath(folder_path), parent_folder_id))
+        failed = None
+        try:
+            tree = journal.meta.get('tree')
+            if tree:
+                print(f"Resuming upload job: {len(journal.done)} files already done")
+                folder_id, folder_map = tree['folder_id'], tree['folder_map']
+                if any(root not in folder_map for root, dirs, files in os.walk(folder_path)):
+                    # local folders added since the crash still need their remote copies
+                    folder_map = self.create_folder_tree(folder_path, folder_id, self.folder_snapshot(folder_id))
+                    journal.set_meta('tree', {'folder_id': folder_id, 'folder_map': folder_map})
+            else:
+                folder_id, folder_map = self.prepare_remote_tree(folder_path, parent_folder_id)
+                journal.set_meta('tree', {'folder_id': folder_id, 'folder_map': folder_map})
+            # existence checks during this upload come from one listing per folder
+            self.folder_cache = RemoteFolderCache(self)
+            failed = 0
+
+            # Step 2: Upload files into the corresponding Google Drive folders
+            self.upload_slots.set_maximum(self.max_uploader_count)
+            with ThreadPoolExecutor(max_workers=self.max_uploader_count) as executor:
+                #store  futures for asunc exec of  uploader
+                futures = []
+
+                for root, dirs, files in os.walk(folder_path):
+                    # Compute the parent folder ID for files in this directory
+                    parent_folder_id = folder_map.get(root, folder_id)
+
+                    # Upload all files in the current directory
+                    for file_name in files:
+                        file_path = os.path.join(root, file_name)
+                        journal.plan(file_path, {'type': 'file', 'parent': parent_folder_id})
+                        if journal.is_done(file_path):
+                            continue
+                        #SUBMIT FILE UPLOAD TASKS TO  BE EXECUTED CONC
+                        metrics.file_queued()
+                        futures.append(executor.submit(self.journaled_upload, journal, file_path, parent_folder_id))
             
-            #wait for all uploads to complete
-            for future in as_completed(futures):
-                try:
-                    future.result() #raise exeptions
-                except Exception as e:
-                    print(f'Error uploading file: {e}')
-
+                #wait for all uploads to complete
+                for future in as_completed(futures):
+                    try:
+                        future.result() #raise exeptions
+                    except Exception as e:
+                        failed += 1
+                        print(f'Error uploading file: {e}')
+        finally:
+            self.folder_cache = None
+            # keep the journal while anything failed (or after a crash) so the next run retries only those
+            journal.close(remove=failed == 0)
         print(f"Uploaded folder: {folder_name} to Google Drive")
+
+    def journaled_upload(self, journal, file_path, folder_id):
+        """upload_file with its start and outcome recorded in the job journal."""
+        journal.started(file_path)
+        try:
+            uploaded_file = self.upload_file(file_path, folder_id)
+        except Exception as e:
+            journal.failure(file_path, e)
+            metrics.file_finished(False)
+            raise
+        journal.finished(file_path)
+        metrics.file_finished(True)
+        return uploaded_file
+
+    def prepare_remote_tree(self, folder_path, parent_folder_id='root'):
+        """Get or create the remote copy of folder_path and all its subfolders.
+
+        Returns (folder_id, {local_dir: folder_id})."""
+        folder_name = os.path.basename(folder_path)
+
+        # Create the main folder on Google Drive, snapshot its remote tree only if it already existed
+        existing_folders = [f for f in self.list_files(folder_name, parent_folder_id) if f['mimeType'] == self.folder_mime_type]
+        if existing_folders:
+            folder_id = existing_folders[0]['id']
+            print(f"Folder '{folder_name}' already exists with ID: {folder_id}, reading its remote tree...")
+            snapshot = self.folder_snapshot(folder_id)
+        else:
+            folder_id = self.batch_create_folders([(folder_name, parent_folder_id)])[0]
+            snapshot = {}
+
+        return folder_id, self.create_folder_tree(folder_path, folder_id, snapshot)
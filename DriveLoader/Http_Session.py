@@ -0,0 +1,80 @@
+import time, threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from DriveLoader.Transfer_Metrics import metrics, endpoint_name
+from DriveLoader.Trace_Hooks import tracer
+
+# (connect, read) seconds; read is the max gap between bytes, not the whole transfer
+DEFAULT_TIMEOUT = (10, 60)
+# connections are opened lazily, so a roomy pool costs nothing until used;
+# threads beyond it still work but their connections are not kept alive
+POOL_SIZE = 64
+
+class TracedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with tracer.span('connect', 'network', host=self.host):
+            super().connect()
+
+class TracedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # TCP and TLS handshake; only new pool connections get here
+        with tracer.span('connect+tls', 'network', host=self.host):
+            super().connect()
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+class TracedAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections show up as 'connect' spans in a trace."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TracedHTTPConnectionPool, 'https': TracedHTTPSConnectionPool}
+
+class DriveSession(requests.Session):
+    """requests.Session with a keep-alive connection pool and default timeouts.
+
+    requests/urllib3 speak HTTP/1.1 only, so reuse comes from the pool: each
+    worker keeps its TCP+TLS connection open instead of handshaking per call.
+    """
+    def __init__(self, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+        # sized once: swapping adapters later would drop the warm connections
+        # and race with threads looking up the adapter of their request
+        self.pool_size = pool_size
+        adapter = TracedAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_name(method, url)
+        start = time.monotonic()
+        with tracer.span(endpoint, 'api') as span:
+            response = super().request(method, url, **kwargs)
+            span.set(status=response.status_code)
+        # until the headers arrived; streamed bodies are timed as transfers
+        metrics.api_call(endpoint, time.monotonic() - start, response.status_code)
+        return response
+
+_sessions = {}  # one pooled session per account, None for unauthenticated calls
+_sessions_lock = threading.Lock()
+
+def get_session(pool_size=POOL_SIZE, credentials=None):
+    """Return the shared DriveSession for `credentials`; `pool_size` applies when it is first created.
+
+    With credentials the session authenticates every request itself, including
+    the refresh-and-retry on 401."""
+    key = id(credentials) if credentials is not None else None
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = DriveSession(pool_size=pool_size)
+            session.auth = credentials
+            _sessions[key] = session
+    return session
@@ -0,0 +1,147 @@
+import os, json, time, hashlib, threading
+from DriveLoader.Client_Credentials import JOBS_DIR
+
+def journal_path(kind, *parts):
+    """Journal file of one job, e.g. journal_path('download', folder_id, folder_path)."""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(JOBS_DIR, f'{kind}-{digest}.jsonl')
+
+class JobJournal:
+    """Append-only JSONL record of a bulk job's plan and progress.
+
+    Every planned item, every listed folder and every start/finish/failure is
+    appended as one line. Writes are buffered and flushed every `flush_every`
+    records or `flush_interval` seconds, so thousands of completions a minute
+    cost a handful of writes. A restarted job replays the file and gets back
+    what is still unfinished; a torn last line from a crash is ignored.
+    """
+    def __init__(self, file_path, flush_every=200, flush_interval=2.0):
+        self.file_path = file_path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+        # replayed state
+        self.plans = {}     # key -> payload of planned items
+        self.done = set()
+        self.failed = {}    # key -> last error
+        self.abandoned = set()  # failed for good, not retried by a rerun
+        self.listed = set() # folders whose listing finished
+        self.meta = {}
+        self.resumed = os.path.exists(file_path)
+        if self.resumed:
+            self._replay()
+
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        self.file = open(file_path, 'a', encoding='utf-8')
+        if self.resumed and self._torn_tail():
+            self.file.write('\n')  # keep new records off the torn line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _replay(self):
+        with open(self.file_path, 'r', encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # half-written line of a crashed run
+                self._apply(record)
+
+    def _torn_tail(self):
+        with open(self.file_path, 'rb') as journal_file:
+            journal_file.seek(0, os.SEEK_END)
+            if not journal_file.tell():
+                return False
+            journal_file.seek(-1, os.SEEK_END)
+            return journal_file.read(1) != b'\n'
+
+    def _apply(self, record):
+        op, key = record.get('op'), record.get('key')
+        if op == 'plan':
+            self.plans[key] = record['item']
+        elif op == 'done':
+            self.done.add(key)
+            self.failed.pop(key, None)
+        elif op == 'fail':
+            self.failed[key] = record.get('error')
+            if record.get('permanent'):
+                self.abandoned.add(key)
+        elif op == 'listed':
+            self.listed.add(key)
+        elif op == 'meta':
+            self.meta[key] = record['value']
+
+    def _append(self, record):
+        with self.lock:
+            self._write(record)
+
+    def _write(self, record):
+        self._apply(record)
+        self.buffer.append(json.dumps(record))
+        if len(self.buffer) >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.file.write('\n'.join(self.buffer) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def plan(self, key, item):
+        """Record a planned item; returns False when it was already planned."""
+        with self.lock:
+            if key in self.plans:
+                return False
+            self._write({'op': 'plan', 'key': key, 'item': item})
+        return True
+
+    def started(self, key):
+        self._append({'op': 'start', 'key': key})
+
+    def finished(self, key):
+        self._append({'op': 'done', 'key': key})
+
+    def failure(self, key, error=None, permanent=False):
+        """Record a failed item; a `permanent` one no longer counts as unfinished."""
+        record = {'op': 'fail', 'key': key, 'error': str(error) if error else None}
+        if permanent:
+            record['permanent'] = True
+        self._append(record)
+
+    def folder_listed(self, key):
+        self._append({'op': 'listed', 'key': key})
+
+    def set_meta(self, key, value):
+        self._append({'op': 'meta', 'key': key, 'value': value})
+
+    def is_done(self, key):
+        with self.lock:
+            return key in self.done
+
+    def unfinished(self, item_type):
+        """Planned items of `item_type` that never finished (in flight or failed included, abandoned not)."""
+        with self.lock:
+            return [(key, item) for key, item in self.plans.items()
+                    if item.get('type') == item_type and key not in self.done and key not in self.abandoned
+                    and (item_type != 'folder' or key not in self.listed)]
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self, remove=False):
+        """Flush and close; `remove` deletes the journal once the job completed cleanly."""
+        with self.lock:
+            self._flush()
+            self.file.close()
+        if remove:
+            os.remove(self.file_path)
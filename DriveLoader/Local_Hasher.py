@@ -0,0 +1,65 @@
+import os, hashlib, sqlite3, threading
+from DriveLoader.Client_Credentials import HASH_CACHE_FILE
+
+def md5_of_file(file_path, block_size=4 * 1024 * 1024):
+    """md5 hex digest of a local file; hashlib releases the GIL on these large blocks."""
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class LocalHasher:
+    """md5 of local files cached by (path, size, mtime_ns).
+
+    Unchanged files are never read twice, even across runs. Hashing runs in the
+    calling upload thread: hashlib drops the GIL while digesting, so the upload
+    workers hash in parallel without a process pool's pickling and fork costs.
+    """
+    def __init__(self, cache_path=HASH_CACHE_FILE):
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                md5 TEXT NOT NULL
+            )''')
+        self.conn.commit()
+
+    def _cached(self, path, stat):
+        with self.lock:
+            row = self.conn.execute('SELECT size, mtime_ns, md5 FROM hashes WHERE path = ?', (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        return None
+
+    def md5(self, file_path):
+        """Return the md5 of file_path, from the cache when the file is unchanged."""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        cached = self._cached(path, stat)
+        if cached:
+            return cached
+
+        md5 = md5_of_file(path)
+
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)', (path, stat.st_size, stat.st_mtime_ns, md5))
+            self.conn.commit()
+        return md5
+
+_hashers = {}  # cache path -> shared hasher
+_hashers_lock = threading.Lock()
+
+def get_hasher(cache_path=HASH_CACHE_FILE):
+    """Return the process-wide LocalHasher of `cache_path`, shared by every uploader."""
+    key = os.path.abspath(cache_path)
+    with _hashers_lock:
+        if key not in _hashers:
+            _hashers[key] = LocalHasher(cache_path)
+        return _hashers[key]
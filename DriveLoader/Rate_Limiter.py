@@ -0,0 +1,45 @@
+import time, threading
+
+class TokenBucket:
+    """Token-bucket bandwidth limiter shared by every transfer thread.
+
+    A rate of 0 means unlimited. Callers reserve bytes up front and sleep off
+    their own debt outside the lock, so waiting workers are served in arrival
+    order and no single worker can starve the others.
+    """
+    def __init__(self, rate=0, burst_seconds=1.0):
+        self.lock = threading.Lock()
+        self.burst_seconds = burst_seconds
+        self.rate = 0
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """Change the limit in bytes/sec (0 = unlimited); safe while transfers are running."""
+        with self.lock:
+            self.rate = max(0, int(rate))
+            self.tokens = min(self.tokens, self.rate * self.burst_seconds)
+            self.last = time.monotonic()
+
+    def reserve(self, amount):
+        """Take `amount` bytes from the bucket and return how long the caller must wait."""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate * self.burst_seconds, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def consume(self, amount):
+        """Block until `amount` bytes may be transferred; returns the seconds spent waiting."""
+        wait = self.reserve(amount)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+# process-wide limits, one per direction
+download_limiter = TokenBucket()
+upload_limiter = TokenBucket()
@@ -0,0 +1,144 @@
+import time, random, threading
+import requests
+from DriveLoader.Transfer_Metrics import metrics
+from DriveLoader.Trace_Hooks import tracer
+
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+def classify(error=None, response=None):
+    """Sort a failed request into 'rate_limit', 'server', 'network' or 'fatal'."""
+    if response is None and isinstance(error, requests.RequestException):
+        response = error.response
+    if response is None:
+        return 'network'
+    error_json = None
+    if response.status_code == 403:
+        try:
+            error_json = response.json()
+        except ValueError:
+            pass
+    return classify_status(response.status_code, error_json)
+
+def classify_status(status, error_json=None):
+    """classify() for a bare status and parsed error body, e.g. a batch sub-response."""
+    if status is None:
+        return 'network'
+    if status == 429:
+        return 'rate_limit'
+    if status == 403:
+        # quota 403s are retried, permission 403s (insufficientFilePermissions...) are not
+        try:
+            reasons = [e.get('reason') for e in error_json['error'].get('errors', [])]
+        except (KeyError, TypeError, AttributeError):
+            reasons = []
+        return 'rate_limit' if any(reason in RATE_LIMIT_REASONS for reason in reasons) else 'fatal'
+    if status in (408, 500, 502, 503, 504):
+        return 'server'
+    return 'fatal'
+
+def retry_after(response):
+    """Seconds from a Retry-After header, or None."""
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class AimdController:
+    """Additive-increase / multiplicative-decrease limit on live concurrency.
+
+    Used as a context manager around each transfer: at most `limit` run at
+    once. Every `limit` successes raise the limit by one (up to `maximum`);
+    throttling halves it, at most once per `cooldown` seconds so one burst of
+    429s counts as a single congestion signal.
+    """
+    def __init__(self, maximum, minimum=1, cooldown=5.0):
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.limit = self.maximum
+        self.cooldown = cooldown
+        self.active = 0
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def set_maximum(self, maximum):
+        with self.condition:
+            self.maximum = max(self.minimum, maximum)
+            self.limit = min(self.limit, self.maximum)
+            self.condition.notify_all()
+
+    def __enter__(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.maximum:
+                self.successes = 0
+                self.limit += 1
+                self.condition.notify()
+
+    def on_throttle(self):
+        with self.condition:
+            now = time.monotonic()
+            if now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            self.successes = 0
+            self.limit = max(self.minimum, self.limit // 2)
+            print(f"\nRate limited by Drive, concurrency reduced to {self.limit}.")
+
+class RetryPolicy:
+    """Shared retry rules: error classification, Retry-After and full-jitter exponential backoff."""
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=64.0, controller=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.controller = controller  # optional AimdController fed with outcomes
+
+    def delay(self, attempt, response=None):
+        server_delay = retry_after(response)
+        if server_delay is not None:
+            return min(server_delay, self.max_delay * 4)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def backoff(self, error, attempt):
+        """Handle one failed attempt; returns False when the error is not worth retrying."""
+        response = error.response if isinstance(error, requests.RequestException) else None
+        kind = classify(error, response)
+        if kind == 'fatal':
+            return False
+        metrics.retry(kind)
+        if kind == 'rate_limit' and self.controller is not None:
+            self.controller.on_throttle()
+        with tracer.span('retry backoff', 'retry', cause=kind, attempt=attempt):
+            time.sleep(self.delay(attempt, response))
+        return True
+
+    def success(self):
+        if self.controller is not None:
+            self.controller.on_success()
+
+    def request(self, session, method, url, **kwargs):
+        """session.request with retries; raises the last error once retries run out."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = session.request(method, url, **kwargs)
+                response.raise_for_status()
+                self.success()
+                return response
+            except requests.RequestException as e:
+                if attempt == self.max_retries or not self.backoff(e, attempt):
+                    raise
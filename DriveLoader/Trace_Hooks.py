@@ -0,0 +1,284 @@
+import os, sys, csv, json, time, cProfile, pstats, threading, functools, collections
+
+class NullSpan:
+    """Stand-in returned while tracing is off; entering it does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    """One timed operation; handed to every hook when it ends."""
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start', 'duration', 'thread_id', 'thread_name')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.duration = 0
+
+    def __enter__(self):
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter_ns() - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.emit(self)
+        return False
+
+    def set(self, **args):
+        """Attach results known only at the end, e.g. a status code."""
+        self.args.update(args)
+
+class TraceHook:
+    """Receives finished spans; subclass and pass to tracer.add_hook."""
+    def on_span(self, span):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class ChromeTraceExporter(TraceHook):
+    """Streams spans as Chrome trace-event JSON (chrome://tracing, Perfetto).
+
+    Events are written as they arrive, so memory stays flat however long the run;
+    close() ends the JSON array.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.threads = set()
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.file = open(path, 'w')
+        self.file.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        self.count = 0
+
+    def _write(self, event):
+        if self.count or self.threads:
+            self.file.write(',\n')
+        self.file.write(json.dumps(event))
+
+    def on_span(self, span):
+        event = {'name': span.name, 'cat': span.category, 'ph': 'X', 'pid': self.pid, 'tid': span.thread_id,
+                 'ts': (span.start - self.origin) / 1000, 'dur': span.duration / 1000, 'args': span.args}
+        with self.lock:
+            if span.thread_id not in self.threads:
+                self._write({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': span.thread_id,
+                             'args': {'name': span.thread_name}})
+                self.threads.add(span.thread_id)
+            self._write(event)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.write('\n]}\n')
+            self.file.close()
+        print(f"Trace with {self.count} spans written to {self.path}")
+
+class CsvExporter(TraceHook):
+    """Streams spans as flat CSV rows: name, category, start/duration in ms, thread, args."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter_ns()
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['name', 'category', 'start_ms', 'duration_ms', 'thread', 'args'])
+        self.count = 0
+
+    def on_span(self, span):
+        row = [span.name, span.category, round((span.start - self.origin) / 1e6, 3), round(span.duration / 1e6, 3),
+               span.thread_name, json.dumps(span.args) if span.args else '']
+        with self.lock:
+            self.writer.writerow(row)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        print(f"Trace with {self.count} spans written to {self.path}")
+
+def exporter_for(path):
+    """Pick the exporter from the file extension (.csv, anything else is Chrome JSON)."""
+    return CsvExporter(path) if path.lower().endswith('.csv') else ChromeTraceExporter(path)
+
+class ChunkProfiler:
+    """Opt-in profiler for the chunk loops, 'cprofile' (exact) or 'sample' (low overhead).
+
+    cProfile runs per thread only while that thread is inside a chunk loop and the
+    results are merged; the sampler polls the stacks of threads inside chunk loops
+    every `interval` seconds and counts where they are.
+    """
+    def __init__(self, mode='cprofile', interval=0.005):
+        if mode not in ('cprofile', 'sample'):
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stats = None
+        self.samples = collections.Counter()
+        self.active = set()  # thread ids inside a chunk loop
+        self.stopped = threading.Event()
+        if mode == 'sample':
+            threading.Thread(target=self._sampler, name='chunk-sampler', daemon=True).start()
+
+    def section(self):
+        return _ProfiledSection(self)
+
+    def _sampler(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                active = set(self.active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    code = frame.f_code
+                    with self.lock:
+                        self.samples[f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'] += 1
+
+    def report(self, path=None, limit=25):
+        """Print the hottest spots; with cProfile, `path` also gets the raw pstats dump."""
+        self.stopped.set()
+        if self.mode == 'sample':
+            total = sum(self.samples.values())
+            print(f"\nChunk loop samples: {total}")
+            for location, count in self.samples.most_common(limit):
+                print(f"{count * 100 / total:6.1f}%  {location}")
+            return
+        if self.stats is None:
+            print("\nNo chunk loop was profiled.")
+            return
+        if path:
+            self.stats.dump_stats(path)
+            print(f"Profile written to {path}")
+        self.stats.sort_stats('cumulative').print_stats(limit)
+
+class _ProfiledSection:
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.profile = None
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.mode == 'sample':
+            with profiler.lock:
+                profiler.active.add(threading.get_ident())
+        else:
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # Python 3.12+: one profiler at a time, and the running one already sees every thread
+                self.profile = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        profiler = self.profiler
+        if profiler.mode == 'sample':
+            with profiler.lock:
+                profiler.active.discard(threading.get_ident())
+            return False
+        if self.profile is None:
+            return False
+        self.profile.disable()
+        with profiler.lock:
+            if profiler.stats is None:
+                profiler.stats = pstats.Stats(self.profile, stream=sys.stdout)
+            else:
+                profiler.stats.add(self.profile)
+        return False
+
+class Tracer:
+    """Process-wide span source for the transfer stack.
+
+    With no hooks registered `enabled` is False and span() returns the shared
+    NullSpan, so the instrumented code pays one attribute check per call site.
+    """
+    def __init__(self):
+        self.hooks = []
+        self.enabled = False
+        self.profiler = None
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        self.enabled = True
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+        self.enabled = bool(self.hooks)
+
+    def span(self, name, category='app', **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def emit(self, span):
+        for hook in self.hooks:
+            hook.on_span(span)
+
+    def iterate(self, iterable, name, category='network'):
+        """Yield from `iterable` with a span per item fetched, e.g. network reads of a stream."""
+        if not self.enabled:
+            return iterable
+        return self._iterate(iterable, name, category)
+
+    def _iterate(self, iterable, name, category):
+        iterator = iter(iterable)
+        while True:
+            with self.span(name, category) as span:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    span.set(end=True)
+                    return
+            yield item
+
+    def profile_chunks(self, mode='cprofile', interval=0.005):
+        """Turn on the chunk loop profiler; see ChunkProfiler."""
+        self.profiler = ChunkProfiler(mode, interval)
+        return self.profiler
+
+    def profiled(self):
+        """Context manager around a chunk loop; a no-op unless profile_chunks() was called."""
+        return NULL_SPAN if self.profiler is None else self.profiler.section()
+
+    def close(self, profile_path=None):
+        """Flush every exporter and print the chunk profile, if any."""
+        for hook in list(self.hooks):
+            hook.close()
+            self.remove_hook(hook)
+        if self.profiler is not None:
+            self.profiler.report(profile_path)
+            self.profiler = None
+
+def traced(name, category='app'):
+    """Decorator: one span per call while tracing is enabled."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(tracer, name, category, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# process-wide, like the metrics and bandwidth limiters
+tracer = Tracer()
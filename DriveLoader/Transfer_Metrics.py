@@ -0,0 +1,202 @@
+import re, json, time, bisect, threading, collections, weakref
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; shared by API latency and time to first byte
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATE_WINDOW = 10.0  # seconds of samples behind bytes/sec
+ID_SEGMENT = re.compile(r'^[-\w]{20,}$')
+
+def endpoint_name(method, url):
+    """Label for an API call with IDs folded away, e.g. 'GET /drive/v3/files/{id}'."""
+    path = urlsplit(url).path
+    segments = ['{id}' if ID_SEGMENT.match(segment) else segment for segment in path.split('/')]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': round(self.total, 6),
+                'avg': round(self.total / self.count, 6) if self.count else None}
+
+class TransferMetrics:
+    """Process-wide counters and histograms of every transfer engine.
+
+    Engines report into it from their worker threads; get_status() reads a
+    snapshot and serve() exposes the same numbers at /metrics in the
+    Prometheus text format.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.bytes = {'download': 0, 'upload': 0}
+        self.samples = {'download': collections.deque(), 'upload': collections.deque()}
+        self.files = {'queued': 0, 'done': 0, 'failed': 0}
+        self.retries = collections.Counter()  # cause -> count
+        self.status_codes = collections.Counter()
+        self.latency = {}  # endpoint -> Histogram
+        self.ttfb = Histogram()
+        self.controllers = {'download': weakref.WeakSet(), 'upload': weakref.WeakSet()}
+        self.server = None
+
+    def watch(self, direction, controller):
+        """Report live and allowed concurrency of an AimdController."""
+        self.controllers[direction].add(controller)
+
+    def add_bytes(self, direction, amount):
+        now = time.monotonic()
+        with self.lock:
+            self.bytes[direction] += amount
+            samples = self.samples[direction]
+            samples.append((now, amount))
+            while samples and now - samples[0][0] > RATE_WINDOW:
+                samples.popleft()
+
+    def file_queued(self, count=1):
+        with self.lock:
+            self.files['queued'] += count
+
+    def file_finished(self, ok=True):
+        with self.lock:
+            self.files['queued'] = max(0, self.files['queued'] - 1)
+            self.files['done' if ok else 'failed'] += 1
+
+    def retry(self, cause):
+        with self.lock:
+            self.retries[cause] += 1
+
+    def api_call(self, endpoint, seconds, status=None):
+        with self.lock:
+            self.latency.setdefault(endpoint, Histogram()).observe(seconds)
+            if status is not None:
+                self.status_codes[status] += 1
+
+    def first_byte(self, seconds):
+        with self.lock:
+            self.ttfb.observe(seconds)
+
+    def rate(self, direction):
+        """Bytes/sec over the last RATE_WINDOW seconds."""
+        now = time.monotonic()
+        with self.lock:
+            samples = self.samples[direction]
+            while samples and now - samples[0][0] > RATE_WINDOW:
+                samples.popleft()
+            return sum(amount for _, amount in samples) / RATE_WINDOW
+
+    def workers(self, direction):
+        controllers = list(self.controllers[direction])
+        return {'active': sum(c.active for c in controllers), 'limit': sum(c.limit for c in controllers)}
+
+    def snapshot(self):
+        rates = {direction: round(self.rate(direction), 1) for direction in self.bytes}
+        workers = {direction: self.workers(direction) for direction in self.bytes}
+        with self.lock:
+            return {
+                'uptime': round(time.time() - self.started, 1),
+                'bytes': dict(self.bytes),
+                'bytes_per_second': rates,
+                'files': dict(self.files),
+                'workers': workers,
+                'retries': dict(self.retries),
+                'rate_limited_429': self.status_codes.get(429, 0),
+                'status_codes': dict(self.status_codes),
+                'api_latency': {endpoint: histogram.snapshot() for endpoint, histogram in self.latency.items()},
+                'time_to_first_byte': self.ttfb.snapshot(),
+            }
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        def histogram(name, help_text, histograms):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, hist in histograms:
+                cumulative = 0
+                for bound, count in zip(list(hist.buckets) + ['+Inf'], hist.counts):
+                    cumulative += count
+                    bucket_labels = ','.join([f'{key}="{val}"' for key, val in labels.items()] + [f'le="{bound}"'])
+                    lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                suffix = f'{{{label_text}}}' if label_text else ''
+                lines.append(f'{name}_sum{suffix} {hist.total}')
+                lines.append(f'{name}_count{suffix} {hist.count}')
+
+        rates = {direction: self.rate(direction) for direction in self.bytes}
+        workers = {direction: self.workers(direction) for direction in self.bytes}
+        with self.lock:
+            metric('gdrive_bytes_total', 'counter', 'Bytes transferred.',
+                   [({'direction': d}, v) for d, v in self.bytes.items()])
+            metric('gdrive_bytes_per_second', 'gauge', f'Transfer rate over the last {RATE_WINDOW:g}s.',
+                   [({'direction': d}, v) for d, v in rates.items()])
+            metric('gdrive_files', 'gauge', 'Files queued, done and failed.',
+                   [({'state': s}, v) for s, v in self.files.items()])
+            metric('gdrive_active_workers', 'gauge', 'Transfers running right now.',
+                   [({'direction': d}, w['active']) for d, w in workers.items()])
+            metric('gdrive_worker_limit', 'gauge', 'Concurrency currently allowed by the AIMD controllers.',
+                   [({'direction': d}, w['limit']) for d, w in workers.items()])
+            metric('gdrive_retries_total', 'counter', 'Retried requests by cause.',
+                   [({'cause': c}, v) for c, v in self.retries.items()])
+            metric('gdrive_responses_total', 'counter', 'API responses by HTTP status.',
+                   [({'status': s}, v) for s, v in self.status_codes.items()])
+            histogram('gdrive_api_latency_seconds', 'API call latency until response headers, per endpoint.',
+                      [({'endpoint': e}, h) for e, h in self.latency.items()])
+            histogram('gdrive_time_to_first_byte_seconds', 'Time from download request to first body byte.',
+                      [({}, self.ttfb)])
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9464, host='127.0.0.1'):
+        """Serve /metrics (Prometheus) and /status (JSON) from a background thread."""
+        if self.server is not None:
+            return self.server
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = metrics.prometheus().encode('utf-8'), 'text/plain; version=0.0.4'
+                elif self.path == '/status':
+                    body, content_type = json.dumps(metrics.snapshot(), indent=2).encode('utf-8'), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the console
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        print(f"Metrics available at http://{host}:{self.server.server_address[1]}/metrics")
+        return self.server
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+# process-wide, like the bandwidth limiters
+metrics = TransferMetrics()
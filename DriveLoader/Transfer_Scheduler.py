@@ -0,0 +1,79 @@
+import queue, threading
+
+class TransferScheduler:
+    """Fixed pool of worker threads fed by a single work queue.
+
+    One scheduler is shared by a whole folder tree, so `worker_count` is the
+    real global concurrency no matter how many folders feed it. When the queue
+    is bounded, `submit` blocks once it is full, which keeps the producer from
+    running arbitrarily far ahead of the workers. A task that raises or returns
+    False (e.g. tracked_downloader giving up on a file) counts as failed.
+    """
+    def __init__(self, worker_count=3, queue_size=None, name='transfer'):
+        self.worker_count = max(1, int(worker_count))
+        # queue_size=0 means unbounded (needed when workers submit more work)
+        if queue_size is None:
+            queue_size = self.worker_count * 4
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.name = name
+
+        self.workers = []
+        self.pending = 0  # submitted but not yet finished
+        self.failed = 0
+        self.completed = 0
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+    def start(self):
+        """Spawn the worker threads (idempotent)."""
+        while len(self.workers) < self.worker_count:
+            worker = threading.Thread(target=self._worker, name=f'{self.name}-{len(self.workers)}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a task, blocking while the queue is full."""
+        with self.lock:
+            self.pending += 1
+        self.tasks.put((func, args, kwargs))
+
+    def _worker(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            func, args, kwargs = task
+            try:
+                failed = func(*args, **kwargs) is False
+            except Exception as e:
+                failed = True
+                print(f"An error occurred during {self.name}: {e}")
+            with self.lock:
+                self.pending -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                if self.pending == 0:
+                    self.idle.notify_all()
+
+    def join(self):
+        """Block until every submitted task (including ones submitted by tasks) is done."""
+        with self.lock:
+            while self.pending:
+                self.idle.wait()
+
+    def shutdown(self):
+        """Stop all workers once the tasks already queued have run."""
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
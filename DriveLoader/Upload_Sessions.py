@@ -0,0 +1,71 @@
+import os, json, threading
+from DriveLoader.Client_Credentials import UPLOAD_SESSIONS_FILE
+
+class UploadSessionExpired(Exception):
+    """The server no longer knows a saved resumable session URI (404/410)."""
+
+class UploadSessionStore:
+    """On-disk journal of open resumable upload sessions.
+
+    Entries are keyed by local file identity and destination, so a restarted
+    upload of the same unchanged file reuses its session URI instead of
+    starting again from byte 0. Only the URI is kept: a resumed upload asks
+    the server how much it has, so the journal is written once per file, not per chunk.
+    """
+    def __init__(self, file_path=UPLOAD_SESSIONS_FILE):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.sessions = self._load()
+
+    def _load(self):
+        if os.path.exists(self.file_path):
+            try:
+                with open(self.file_path, 'r') as json_file:
+                    return json.load(json_file)
+            except ValueError:
+                print(f"{self.file_path} is corrupted, ignoring saved upload sessions.")
+        return {}
+
+    def _save(self):
+        directory = os.path.dirname(self.file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # write-then-rename so a crash never leaves a half-written journal
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'w') as json_file:
+            json.dump(self.sessions, json_file)
+        os.replace(tmp_path, self.file_path)
+
+    @staticmethod
+    def key(file_path, folder_id):
+        stat = os.stat(file_path)
+        return f'{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{folder_id}'
+
+    def get(self, key):
+        with self.lock:
+            entry = self.sessions.get(key)
+            return entry['upload_url'] if entry else None
+
+    def open(self, key, upload_url):
+        with self.lock:
+            self.sessions[key] = {'upload_url': upload_url}
+            self._save()
+
+    def close(self, key):
+        with self.lock:
+            if self.sessions.pop(key, None) is not None:
+                self._save()
+
+_stores = {}  # journal path -> the one store writing it
+_stores_lock = threading.Lock()
+
+def get_upload_sessions(file_path=UPLOAD_SESSIONS_FILE):
+    """Return the process-wide UploadSessionStore of `file_path`.
+
+    Each store rewrites the whole file from its own dict, so two stores on one
+    file would drop each other's sessions and race on the .tmp rename."""
+    key = os.path.abspath(file_path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = UploadSessionStore(file_path)
+        return _stores[key]
@@ -1,8 +1,9 @@
-import os, json, requests
-from google.oauth2.credentials import Credentials
+import os, json, threading
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from DriveLoader.Client_Credentials import CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, USER_AUTH_FILE, TOKEN_FILE
+from DriveLoader.Client_Credentials import CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, USER_AUTH_FILE, TOKEN_FILE, API_ROOT
+from DriveLoader.Http_Session import get_session
+from DriveLoader.Credential_Manager import DriveCredentials
+from DriveLoader.Trace_Hooks import tracer, traced
 
 class UserControl:
     def __init__(self):
@@ -10,6 +11,9 @@ class UserControl:
         self.client_secret = CLIENT_SECRET
         self.redirect_uri = REDIRECT_URI
         self.current_email = None
+        self.session = get_session()
+        self.credentials = {}  # email -> DriveCredentials for this run
+        self.tokens_lock = threading.Lock()
 
     def save_to_file(self, file_path, data):
         """Helper function to save data to a JSON file."""
@@ -23,17 +27,19 @@ class UserControl:
                 return json.load(json_file)
         return {}
 
+    @traced('user info', 'auth')
     def get_user_info(self, access_token):
         """Retrieve user information using the Google UserInfo API."""
-        userinfo_url = "https://www.googleapis.com/drive/v3/about/?fields=user"
+        userinfo_url = f"{API_ROOT}/drive/v3/about/?fields=user"
         headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(userinfo_url, headers=headers)
+        response = self.session.get(userinfo_url, headers=headers)
         
         if response.status_code == 200:
             return response.json()
         else:
             raise ValueError("Failed to fetch user information from Google UserInfo API.")
         
+    @traced('oauth consent', 'auth')
     def generate_user_auth(self, scopes=['https://www.googleapis.com/auth/drive']):
         """Generate a new user auth entry and store refresh token in user_auth.json."""
         flow = InstalledAppFlow.from_client_config(
@@ -93,71 +99,81 @@ class UserControl:
         else:
             raise ValueError("Invalid selection.")
     
-    def get_direct_access_token(self, email=None, scopes=['https://www.googleapis.com/auth/drive']):
-        '''Retrieve or refresh access token for the given user'''
-        try:
-            access_token_data = self.load_from_file(TOKEN_FILE)
-            if not email:
-                first_key = next(iter(access_token_data))
-                print(f"Default First Email Selected: {first_key}")
-                access_token = access_token_data[first_key].get('access_token')  ##needed to be patched
-            else:
-                access_token = access_token_data[email]['access_token'] 
-            # Check access token validity
-            if access_token:
-                try:
-                    user_info = self.get_user_info(access_token=access_token)
-                    if user_info:
-                        return access_token
-                except ValueError:
-                    print("Invalid access token. Refreshing...")
-            
-            return self.get_user_access_token()
-
-        except:
-            print("Re Generating user access token....")
-            return self.get_user_access_token()
-
-    def get_user_access_token(self, user_email=None, scopes=['https://www.googleapis.com/auth/drive']):
-        """Retrieve or refresh access token for the given user."""
-        if user_email is None:
-            user_email = self.select_user_email()
-            self.current_email = user_email
+    def default_email(self):
+        """First account with a saved access token, or None to prompt for one."""
+        user_auth_data = self.load_from_file(USER_AUTH_FILE)
+        first_key = next((email for email in self.load_from_file(TOKEN_FILE) if email in user_auth_data), None)
+        if first_key:
+            print(f"Default First Email Selected: {first_key}")
+        return first_key
+
+    @traced('save token', 'disk')
+    def save_access_token(self, credentials):
+        """Persist a freshly refreshed token (portable tokens); only called on refresh."""
+        with self.tokens_lock:
+            tokens_data = self.load_from_file(TOKEN_FILE)
+            tokens_data[credentials.email] = {"access_token": credentials.access_token, "expiry": credentials.expiry}
+            self.save_to_file(TOKEN_FILE, tokens_data)
+        print(f"Access token for {credentials.email} saved to {TOKEN_FILE}")
+
+    def list_emails(self):
+        """All authorized account emails."""
+        return list(self.load_from_file(USER_AUTH_FILE).keys())
+
+    def get_credentials(self, email=None, make_current=True):
+        """Return the in-memory, self-refreshing credentials of a user.
+
+        tokens.json is read once per user and only written when the token is refreshed;
+        no network call is made while the cached token is still within its lifetime."""
+        if email is None:
+            email = self.select_user_email()
+        if make_current:
+            self.current_email = email
+        if email in self.credentials:
+            return self.credentials[email]
 
         user_auth_data = self.load_from_file(USER_AUTH_FILE)
-        if user_email not in user_auth_data:
-            raise ValueError(f"No credentials found for {user_email} in {USER_AUTH_FILE}.")
+        if email not in user_auth_data:
+            raise ValueError(f"No credentials found for {email} in {USER_AUTH_FILE}.")
 
-        refresh_token = user_auth_data[user_email].get('refresh_token')
+        refresh_token = user_auth_data[email].get('refresh_token')
         if not refresh_token:
-            raise ValueError(f"Refresh token for {user_email} is missing.")
+            raise ValueError(f"Refresh token for {email} is missing.")
 
-        creds = Credentials(
-            None,
+        cached = self.load_from_file(TOKEN_FILE).get(email, {})
+        credentials = DriveCredentials(
             refresh_token=refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
             client_id=self.client_id,
-            client_secret=self.client_secret
+            client_secret=self.client_secret,
+            email=email,
+            # entries saved before expiry tracking are of unknown age, refresh those
+            access_token=cached.get('access_token') if cached.get('expiry') else None,
+            expiry=cached.get('expiry', 0),
+            on_refresh=self.save_access_token,
         )
 
         # Refresh the token if expired
-        if not creds.valid:
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"Error during token refresh: {e}")
-                self.generate_user_auth()
-                print("User Authenticated again!")
-                return self.get_user_access_token(user_email=user_email) 
+        try:
+            with tracer.span('validate token', 'auth', email=email):
+                credentials.token()
+        except Exception as e:
+            print(f"Error during token refresh: {e}")
+            self.generate_user_auth()
+            print("User Authenticated again!")
+            return self.get_credentials(email=email, make_current=make_current)
 
-        # Save the access token to tokens.json
-        tokens_data = self.load_from_file(TOKEN_FILE)
-        tokens_data[user_email] = {"access_token": creds.token}
-        self.save_to_file(TOKEN_FILE, tokens_data)
+        self.credentials[email] = credentials
+        return credentials
 
-        print(f"Access token for {user_email} saved to {TOKEN_FILE}")
-        return creds.token
+    def get_direct_access_token(self, email=None, scopes=['https://www.googleapis.com/auth/drive']):
+        '''Retrieve or refresh access token for the given user (default: first saved user)'''
+        return self.get_credentials(email or self.default_email()).token()
+
+    def get_user_access_token(self, user_email=None, scopes=['https://www.googleapis.com/auth/drive']):
+        """Retrieve or refresh access token for the given user."""
+        return self.get_credentials(user_email).token()
 
+    @traced('revoke token', 'auth')
     def revoke_token(self, user_email=None):
         """Revoke the user's access and refresh tokens and delete them from the storage."""
         if user_email is None:
@@ -173,10 +189,11 @@ class UserControl:
 
         revoke_url = "https://oauth2.googleapis.com/revoke"
         headers = {'content-type': 'application/x-www-form-urlencoded'}
-        response = requests.post(revoke_url, data={'token': refresh_token}, headers=headers)
+        response = self.session.post(revoke_url, data={'token': refresh_token}, headers=headers)
 
         if response.status_code == 200:
             print(f"Token for {user_email} has been successfully revoked.")
+            self.credentials.pop(user_email, None)
             del user_auth_data[user_email]
             self.save_to_file(USER_AUTH_FILE, user_auth_data)
 
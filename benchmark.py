@@ -0,0 +1,244 @@
+"""Benchmarks against a local fake Drive server, no network or Google account needed.
+
+    python benchmark.py --scenario all --latency 0.02 --error-rate 0.01 --disconnect-rate 0.01
+
+Every scenario (many tiny files, few huge files, deep nesting) is listed,
+downloaded with each engine and uploaded with each multipart threshold; the
+report shows time, throughput, request counts and whether the result was complete.
+"""
+import os, sys, json, time, argparse, tempfile, contextlib
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from DriveLoader.Fake_Drive import FakeDrive, FaultConfig, PATTERN
+from DriveLoader.Trace_Hooks import tracer, exporter_for
+
+KB = 1024
+MB = 1024 * KB
+
+def scenario_files(name, scale=1.0):
+    """[(relative folder parts, file name, size)] of a synthetic tree."""
+    files = []
+    if name == 'tiny':
+        for folder in range(max(1, int(20 * scale))):
+            for index in range(100):
+                files.append(((f'dir{folder:03}',), f'tiny{index:03}.bin', 4 * KB))
+    elif name == 'huge':
+        for index in range(4):
+            files.append(((), f'huge{index}.bin', int(128 * MB * scale)))
+    elif name == 'deep':
+        parts = ()
+        for depth in range(max(1, int(25 * scale))):
+            parts += (f'level{depth:02}',)
+            for index in range(4):
+                files.append((parts, f'file{index}.bin', 256 * KB))
+    else:
+        raise ValueError(f"Unknown scenario: {name}")
+    return files
+
+def populate_remote(drive, root_name, files):
+    """Create the tree on the fake server; returns (root id, [folder ids])."""
+    root_id = drive.add_folder(root_name)
+    folders = {(): root_id}
+    for parts, file_name, size in files:
+        for depth in range(1, len(parts) + 1):
+            if parts[:depth] not in folders:
+                folders[parts[:depth]] = drive.add_folder(parts[depth - 1], folders[parts[:depth - 1]])
+        drive.add_file(file_name, folders[parts], size=size)
+    return root_id, list(folders.values())
+
+def write_local(root_path, files):
+    for parts, file_name, size in files:
+        folder = os.path.join(root_path, *parts)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, file_name), 'wb') as out_file:
+            while size > 0:
+                size -= out_file.write(PATTERN[:min(size, len(PATTERN))])
+
+def local_tree_size(root_path):
+    count = total = 0
+    for root, dirs, names in os.walk(root_path):
+        for name in names:
+            if name.startswith('.gdrive_manifest') or name.endswith(('.part', '.part.meta', '.part.segments')):
+                continue
+            count += 1
+            total += os.path.getsize(os.path.join(root, name))
+    return count, total
+
+def remote_tree_size(drive, folder_id):
+    count = total = 0
+    for child in drive.children(folder_id):
+        if child.is_folder:
+            sub_count, sub_total = remote_tree_size(drive, child.id)
+            count += sub_count
+            total += sub_total
+        else:
+            count += 1
+            total += child.size
+    return count, total
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Send stdout/stderr (tqdm bars, clear_console) to /dev/null at the fd level."""
+    if not enabled:
+        yield
+        return
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        os.dup2(devnull.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+def measure(drive, func, quiet_output):
+    drive.reset_stats()
+    start = time.perf_counter()
+    error = None
+    with quiet(quiet_output):
+        try:
+            func()
+        except Exception as e:
+            error = e
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(drive.stats.values()), dict(drive.injected), dict(drive.stats), error
+
+def run(args, drive):
+    # DriveLoader reads GDRIVE_API_ROOT on import, so these come after the server is up
+    from DriveLoader.Gdrive_Downloader import Gdrive_Bulker
+    from DriveLoader.Gdrive_Uploader import GdriveUploader
+    from DriveLoader.Drive_Browser import DriveBrowser
+
+    token = 'fake-token'
+    results = []
+
+    def report(scenario, operation, variant, elapsed, requests_made, injected, stats, error, files, total, expected):
+        row = {
+            'scenario': scenario, 'operation': operation, 'variant': variant,
+            'seconds': round(elapsed, 3),
+            'MB/s': round(total / MB / elapsed, 2) if elapsed and total else 0.0,
+            'files/s': round(files / elapsed, 1) if elapsed else 0.0,
+            'requests': requests_made,
+            '429s': injected.get('429', 0), 'disconnects': injected.get('disconnect', 0),
+            'complete': error is None and (files, total) == expected,
+            'error': str(error) if error else None,
+            'endpoints': stats,
+        }
+        results.append(row)
+        print(f"{scenario:<6} {operation:<14} {variant:<18} {row['seconds']:>9.2f}s {row['MB/s']:>9.2f} MB/s "
+              f"{row['files/s']:>9.1f} files/s {requests_made:>7} req {row['429s']:>5} 429 {row['disconnects']:>5} cut  "
+              f"{'ok' if row['complete'] else 'INCOMPLETE'}{' ' + row['error'] if error else ''}")
+
+    print(f"{'scen.':<6} {'operation':<14} {'variant':<18} {'time':>10} {'throughput':>14} {'rate':>17} {'requests':>11}")
+    for scenario in args.scenarios:
+        files = scenario_files(scenario, args.scale)
+        expected = (len(files), sum(size for _, _, size in files))
+        root_id, folder_ids = populate_remote(drive, f'bench-{scenario}', files)
+
+        # listing: every folder of the tree, one call chain at a time
+        bulker = Gdrive_Bulker(token)
+        bulker.page_size = args.page_size
+        def list_with_file_lister():
+            for folder_id in folder_ids:
+                page_token = None
+                while True:
+                    page = bulker.file_lister(folder_id, page_token)
+                    page_token = page.get('nextPageToken')
+                    if not page_token:
+                        break
+        elapsed, requests_made, injected, stats, error = measure(drive, list_with_file_lister, not args.verbose)
+        report(scenario, 'list', 'file_lister', elapsed, requests_made, injected, stats, error, len(folder_ids), 0, (len(folder_ids), 0))
+
+        with quiet(not args.verbose):
+            browser = DriveBrowser(token)
+        elapsed, requests_made, injected, stats, error = measure(
+            drive, lambda: [browser.get_list_files(folder_id) for folder_id in folder_ids], not args.verbose)
+        report(scenario, 'list', 'get_list_files', elapsed, requests_made, injected, stats, error, len(folder_ids), 0, (len(folder_ids), 0))
+
+        for engine in args.engines:
+            bulker = Gdrive_Bulker(token)
+            bulker.engine = engine
+            bulker.max_downloader_count = args.workers
+            bulker.page_size = args.page_size
+            dest = tempfile.mkdtemp(prefix=f'download-{scenario}-{engine}-', dir=args.workdir)
+            elapsed, requests_made, injected, stats, error = measure(
+                drive, lambda: bulker.download_folder(root_id, dest), not args.verbose)
+            count, total = local_tree_size(dest)
+            report(scenario, 'download_folder', engine, elapsed, requests_made, injected, stats, error, count, total, expected)
+
+        source = os.path.join(tempfile.mkdtemp(prefix=f'upload-{scenario}-', dir=args.workdir), f'bench-{scenario}')
+        write_local(source, files)
+        for threshold in args.multipart_thresholds:
+            uploader = GdriveUploader(token)
+            uploader.max_uploader_count = args.workers
+            uploader.multipart_threshold = threshold
+            parent_id = drive.add_folder(f'upload-target-{threshold}')
+            elapsed, requests_made, injected, stats, error = measure(
+                drive, lambda: uploader.upload_folder(source, parent_id), not args.verbose)
+            count, total = remote_tree_size(drive, parent_id)
+            report(scenario, 'upload_folder', f'multipart<{threshold // KB}KiB', elapsed, requests_made, injected, stats, error, count, total, expected)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transfers against a local fake Drive server")
+    parser.add_argument('--scenario', default='all', help="tiny, huge, deep or all (comma separated)")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies file counts (tiny, deep) and sizes (huge)")
+    parser.add_argument('--engines', default='threaded,asyncio', help="download engines to compare")
+    parser.add_argument('--multipart-thresholds', default=f'0,{5 * MB}', help="upload multipart thresholds in bytes to compare")
+    parser.add_argument('--workers', type=int, default=8, help="concurrent transfers")
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--bandwidth', type=int, default=0, help="server-wide media bytes/sec, 0 = unlimited")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help="share of transfers cut off midway")
+    parser.add_argument('--seed', type=int, default=1, help="fault injection seed, for repeatable runs")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--verbose', action='store_true', help="keep the tool's own output")
+    parser.add_argument('--trace', help="record spans of every run to this file (.json for chrome://tracing, .csv)")
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], help="profile the chunk loops of every run")
+    args = parser.parse_args()
+
+    args.scenarios = ['tiny', 'huge', 'deep'] if args.scenario == 'all' else args.scenario.split(',')
+    args.engines = [engine for engine in args.engines.split(',') if engine]
+    args.multipart_thresholds = [int(value) for value in args.multipart_thresholds.split(',')]
+    if 'asyncio' in args.engines:
+        try:
+            import aiohttp  # noqa: F401
+        except ImportError:
+            print("aiohttp is not installed, skipping the asyncio engine.")
+            args.engines.remove('asyncio')
+
+    faults = FaultConfig(latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate,
+                         disconnect_rate=args.disconnect_rate, seed=args.seed)
+    with FakeDrive(faults) as drive, tempfile.TemporaryDirectory(prefix='gdrive-bench-') as workdir:
+        os.environ['GDRIVE_API_ROOT'] = drive.url
+        args.workdir = workdir
+        # UserData journals and caches of the runs stay inside the scratch directory
+        json_path = os.path.abspath(args.json) if args.json else None
+        if args.trace:
+            tracer.add_hook(exporter_for(os.path.abspath(args.trace)))
+        if args.profile:
+            tracer.profile_chunks(args.profile)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            results = run(args, drive)
+        finally:
+            os.chdir(cwd)
+            tracer.close()
+
+    if json_path:
+        with open(json_path, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f"Results written to {json_path}")
+    if not all(row['complete'] for row in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,10 @@ def link_to_id(link):
     else:
         raise ValueError(f"Unable to extract ID from link: {link}")
 
+def escape_query_value(value):
+    """Escape a string for use inside a quoted Drive search query value."""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
 def sanitizer_names(filename):
     """Sanitize filenames to avoid invalid characters."""
     filename = re.sub(r"[<>:\"/|?*\'\x00-\x1F]", '_', filename).strip()
@@ -1,16 +1,23 @@
+import os, sys, json, argparse, importlib.util
 from UserControl import UserControl
 from DriveLoader.Drive_Browser import DriveBrowser
+from DriveLoader.Drive_Sync import DriveMirror
+from DriveLoader.Account_Shards import ShardedTransfer
+from DriveLoader.Batch_Jobs import BatchJob, JobEntry, read_job_file
+from DriveLoader.Rate_Limiter import download_limiter, upload_limiter
+from DriveLoader.Transfer_Metrics import metrics
+from DriveLoader.Trace_Hooks import tracer, exporter_for
 from functions import link_to_id, clear_console
 
 # Setup logging
 
 
 class GDriveManager:
-    def __init__(self):
+    def __init__(self, email=None):
         self.ucontrol = UserControl()
-        self.access_token = self.ucontrol.get_direct_access_token()
+        self.credentials = self.ucontrol.get_credentials(email or self.ucontrol.default_email())
 
-        self.drivebrowser = DriveBrowser(access_token=self.access_token)
+        self.drivebrowser = DriveBrowser(credentials=self.credentials)
 
     def get_download_folder(self):
         """Prompt user for the download folder name."""
@@ -57,17 +64,124 @@ class GDriveManager:
             except Exception as e:
                 print(f"Error downloading file: {e}")
 
+    def sync_folder(self):
+        """Mirror a Google Drive folder locally, fetching only what changed since the last sync."""
+        folder_id = self.get_folder_id("Enter Drive Folder Link To Mirror")
+        if folder_id:
+            folder_name = input("Enter Local Mirror Folder Name: ").strip() or self.drivebrowser.downloader.downloader_path
+            try:
+                DriveMirror(self.drivebrowser.downloader, folder_id, folder_name).sync()
+            except Exception as e:
+                print(f"Error syncing folder: {e}")
+
     def bulk_download_links(self):
         """Download multiple Google Drive links."""
-        links = self.enter_bulk_links()
-        for link in links:
+        downloader = self.drivebrowser.downloader
+        entries = {}
+        for link in self.enter_bulk_links():
             try:
-                folder_id = link_to_id(link)
-                print(f"Extracted ID: {folder_id} from link: {link}")
-                self.drivebrowser.downloader.root_folder_id = folder_id
-                self.drivebrowser.downloader.download_folder()
-            except Exception as e:
-                print(f"Error with link {link}: {e}")
+                file_id = link_to_id(link)
+            except ValueError as e:
+                print(e)
+                continue
+            entries.setdefault(file_id, JobEntry(file_id, link, downloader.downloader_path))
+        if entries:
+            # files and folders alike, all links through one shared scheduler
+            BatchJob(downloader).run(list(entries.values()))
+
+    def run_jobs(self, job_file):
+        """Headless mode: download every link of a job file, returns the number of failures."""
+        downloader = self.drivebrowser.downloader
+        entries = read_job_file(job_file, downloader.downloader_path)
+        if not entries:
+            print(f"No links found in {job_file}")
+            return 0
+        _, failed = BatchJob(downloader).run(entries)
+        return failed
+
+    def switch_engine(self):
+        """Toggle between the threaded and the asyncio download engine."""
+        downloader = self.drivebrowser.downloader
+        engine = input(f"Engine [threaded/asyncio] (current: {downloader.engine}): ").strip().lower()
+        if engine not in ('threaded', 'asyncio'):
+            print("Unknown engine, keeping the current one.")
+            return
+        if engine == 'asyncio':
+            if importlib.util.find_spec('aiohttp') is None:
+                print("The asyncio engine needs aiohttp: pip install aiohttp")
+                return
+            count = input(f"Max transfers in flight (current: {downloader.max_async_count}): ").strip()
+            if count.isdigit() and int(count) > 0:
+                downloader.max_async_count = int(count)
+        downloader.engine = engine
+
+    def set_bandwidth_limits(self):
+        """Cap total download/upload throughput across all workers (0 = unlimited)."""
+        try:
+            download_kbps = int(input(f"Max download KB/s (current: {download_limiter.rate // 1024}, 0 = unlimited): ") or download_limiter.rate // 1024)
+            upload_kbps = int(input(f"Max upload KB/s (current: {upload_limiter.rate // 1024}, 0 = unlimited): ") or upload_limiter.rate // 1024)
+        except ValueError:
+            print("Invalid number, limits unchanged.")
+            return
+        download_limiter.set_rate(download_kbps * 1024)
+        upload_limiter.set_rate(upload_kbps * 1024)
+
+    def select_accounts(self):
+        """Pick the accounts a sharded transfer should use (default: all of them)."""
+        emails = self.ucontrol.list_emails()
+        for i, email in enumerate(emails):
+            print(f"{i + 1}. {email}")
+        choice = input("Accounts to use, e.g. 1,3 (Enter for all): ").strip()
+        if choice:
+            try:
+                emails = [emails[int(i) - 1] for i in choice.split(',')]
+            except (ValueError, IndexError):
+                print("Invalid selection.")
+                return []
+        return [self.ucontrol.get_credentials(email, make_current=False) for email in emails]
+
+    def sharded_download(self):
+        """Download a folder using several accounts at once."""
+        folder_id = self.get_folder_id()
+        if not folder_id:
+            return
+        credentials_list = self.select_accounts()
+        if not credentials_list:
+            return
+        downloader = self.drivebrowser.downloader
+        try:
+            ShardedTransfer(credentials_list, workers_per_account=downloader.max_downloader_count).download_folder(folder_id, downloader.downloader_path)
+        except Exception as e:
+            print(f"Error downloading folder: {e}")
+        input("\nEnter to go back.")
+
+    def sharded_upload(self):
+        """Upload a local folder using several accounts at once."""
+        folder_path = input("Enter Local Folder Path: ").strip()
+        if not os.path.isdir(folder_path):
+            print("Folder not found.")
+            return
+        parent_folder_id = self.get_folder_id("Enter Target Drive Folder Link (shared with all accounts)") or 'root'
+        credentials_list = self.select_accounts()
+        if not credentials_list:
+            return
+        try:
+            ShardedTransfer(credentials_list).upload_folder(folder_path, parent_folder_id)
+        except Exception as e:
+            print(f"Error uploading folder: {e}")
+        input("\nEnter to go back.")
+
+    def show_status(self):
+        """Print the transfer metrics and optionally serve them for Prometheus."""
+        print(json.dumps(self.drivebrowser.downloader.get_status(), indent=2))
+        if metrics.server is None:
+            port = input("Serve /metrics on port (Enter to skip): ").strip()
+            if port:
+                try:
+                    metrics.serve(int(port))
+                except (ValueError, OSError) as e:
+                    print(f"Could not start metrics endpoint: {e}")
+        input("\nEnter to go back.")
 
     def display_menu(self):
         """Display the menu and return the user's choice."""
@@ -91,6 +205,16 @@ class GDriveManager:
         -> 6. Single Folder Download
         -> 7. Single File Download
         -> 8. Set Download Folder Name
+        -> 11. Set Segments For Large Single Files
+        -> 12. Switch Download Engine (threaded/asyncio)
+        -> 13. Sync Mirror Folder (only changes since last sync)
+        -> 14. Set Bandwidth Limits
+
+        Multi-Account [GDrive] [SHARDED]
+        -> 15. Folder Download With Several Accounts
+        -> 16. Folder Upload With Several Accounts
+
+        -> 17. Transfer Status / Metrics Endpoint
 
         9. About
         10. Exit
@@ -98,7 +222,7 @@ class GDriveManager:
         print(menu)
 
         try:
-            return int(input("Select an option (1-10): "))
+            return int(input("Select an option (0-17): "))
         except ValueError:
             print("Invalid option selected.")
             return self.display_menu()
@@ -109,7 +233,7 @@ class GDriveManager:
         print("GDrive Manager - A tool for managing Google Drive files and folders.")
         print("Developed by Kamruzzaman Tanvir - For learning purposes.")
         print("\n\nUserInformation: ")
-        user_information = self.ucontrol.get_user_info(self.ucontrol.get_direct_access_token(email=self.ucontrol.current_email))
+        user_information = self.ucontrol.get_user_info(self.credentials.token())
         print(f"Type: {user_information['user']['kind']}")
         print(f"Name: {user_information['user']['displayName']}")
         print(f"Email Address: {user_information['user']['emailAddress']}")
@@ -123,7 +247,8 @@ class GDriveManager:
             option = self.display_menu()
 
             if option == 1:
-                self.drivebrowser.token_reset(self.ucontrol.get_user_access_token())
+                self.credentials = self.ucontrol.get_credentials()
+                self.drivebrowser.token_reset(self.credentials)
             elif option == 2:
                 self.ucontrol.generate_user_auth()
             elif option == 3:
@@ -147,6 +272,21 @@ class GDriveManager:
                 self.get_download_folder()
             elif option == 9:
                 self.about()
+            elif option == 11:
+                segment_count = int(input("Enter Segments Per Large File (0 to disable): "))
+                self.drivebrowser.downloader.segment_count = segment_count
+            elif option == 12:
+                self.switch_engine()
+            elif option == 13:
+                self.sync_folder()
+            elif option == 14:
+                self.set_bandwidth_limits()
+            elif option == 15:
+                self.sharded_download()
+            elif option == 16:
+                self.sharded_upload()
+            elif option == 17:
+                self.show_status()
             elif option == 10:
                 print("Exiting program.")
                 break
@@ -155,5 +295,35 @@ class GDriveManager:
             clear_console()
 
 if __name__ == "__main__":
-    clear_console()
-    GDriveManager().run()
+    parser = argparse.ArgumentParser(description="Google Drive bulk downloader")
+    parser.add_argument('--jobs', help="job file to run without the menu: one link per line, or JSONL with link/dest/segmented")
+    parser.add_argument('--email', help="account to use (default: first saved account)")
+    parser.add_argument('--dest', help="default download folder for the job file")
+    parser.add_argument('--workers', type=int, help="max concurrent downloads")
+    parser.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on this local port")
+    parser.add_argument('--trace', help="record timed spans of API calls, chunk reads/writes and retries to this file (.json for chrome://tracing, .csv)")
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], help="profile the download/upload chunk loops")
+    parser.add_argument('--profile-out', help="also dump the cProfile stats to this file (for snakeviz, pstats)")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.trace:
+        tracer.add_hook(exporter_for(args.trace))
+    if args.profile:
+        tracer.profile_chunks(args.profile)
+
+    try:
+        if args.jobs:
+            manager = GDriveManager(email=args.email)
+            if args.dest:
+                manager.drivebrowser.downloader.downloader_path = args.dest
+            if args.workers:
+                manager.drivebrowser.downloader.max_downloader_count = args.workers
+            sys.exit(1 if manager.run_jobs(args.jobs) else 0)
+
+        clear_console()
+        GDriveManager(email=args.email).run()
+    finally:
+        # written on exit, Ctrl+C included
+        tracer.close(args.profile_out)
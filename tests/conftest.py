@@ -0,0 +1,29 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DriveLoader.Fake_Drive import FakeDrive, FaultConfig
+
+# DriveLoader reads GDRIVE_API_ROOT on import, so the server is up before any test module loads
+fake_drive = FakeDrive().__enter__()
+os.environ['GDRIVE_API_ROOT'] = fake_drive.url
+
+@pytest.fixture
+def drive(tmp_path, monkeypatch):
+    """The shared fake Drive with faults off, run from an empty working directory."""
+    monkeypatch.chdir(tmp_path)
+    fake_drive.faults = FaultConfig(seed=7)
+    fake_drive.reset_stats()
+    yield fake_drive
+    fake_drive.faults = FaultConfig()
+
+@pytest.fixture
+def bulker(drive):
+    from DriveLoader.Gdrive_Downloader import Gdrive_Bulker
+    bulker = Gdrive_Bulker('test-token')
+    bulker.retry_policy.base_delay = 0.01
+    return bulker
+
+def pytest_sessionfinish(session, exitstatus):
+    fake_drive.stop()
@@ -0,0 +1,115 @@
+import os, json
+import requests
+from DriveLoader.Client_Credentials import JOBS_DIR
+from DriveLoader.Download_Manifest import part_revision
+from DriveLoader.Drive_Sync import DriveMirror
+from DriveLoader.Gdrive_Uploader import GdriveUploader
+from DriveLoader import Drive_Batch
+
+def record_offsets(bulker):
+    """Wrap fetch_to_part and return the list of offsets it is called with."""
+    offsets = []
+    fetch = bulker.fetch_to_part
+    def wrapper(file_id, part_path, offset, *args, **kwargs):
+        offsets.append(offset)
+        return fetch(file_id, part_path, offset, *args, **kwargs)
+    bulker.fetch_to_part = wrapper
+    return offsets
+
+def test_part_file_resumes_after_disconnect(drive, bulker):
+    content = os.urandom(512 * 1024)
+    drive_file = bulker.file_metadata(drive.add_file('big.bin', content=content))
+    offsets = record_offsets(bulker)
+
+    drive.faults.disconnect_rate = 1.0
+    assert not bulker.file_downloader(drive_file, 'out', max_retries=1)
+    partial = os.path.getsize('out/big.bin.part')
+    assert 0 < partial < len(content)
+
+    drive.faults.disconnect_rate = 0.0
+    assert bulker.file_downloader(drive_file, 'out')
+    assert offsets == [0, partial]
+    with open('out/big.bin', 'rb') as downloaded:
+        assert downloaded.read() == content
+    assert not os.path.exists('out/big.bin.part.meta')
+
+def test_md5_mismatch_downloads_again(drive, bulker):
+    content = b'the real content' * 1000
+    drive_file = bulker.file_metadata(drive.add_file('notes.txt', content=content))
+    os.makedirs('out')
+    # a complete-looking .part of the same revision, but with the wrong bytes
+    with open('out/notes.txt.part', 'wb') as part_file:
+        part_file.write(b'x' * len(content))
+    with open('out/notes.txt.part.meta', 'w') as meta_file:
+        json.dump(part_revision(drive_file), meta_file)
+    offsets = record_offsets(bulker)
+
+    assert bulker.file_downloader(drive_file, 'out')
+    assert offsets == [0]
+    with open('out/notes.txt', 'rb') as downloaded:
+        assert downloaded.read() == content
+
+def test_journal_replay_with_permanent_failure(drive, bulker):
+    root = drive.add_folder('Job')
+    drive.add_file('a.bin', root, content=b'a' * 500)
+    drive.add_file('Notes', root, size=300, downloadable=False)
+    drive.add_file('Plan', root, mime_type='application/vnd.google-apps.document')
+
+    # a.bin fails the first run, so the job is left unfinished with its journal
+    download = bulker.file_downloader
+    bulker.file_downloader = lambda drive_file, *args, **kwargs: (
+        False if drive_file.name == 'a.bin' else download(drive_file, *args, **kwargs))
+    assert not bulker.download_folder(root, 'out')
+    assert len(os.listdir(JOBS_DIR)) == 1
+
+    bulker.file_downloader = download
+    drive.add_file('new.bin', root, content=b'n' * 10)
+    assert bulker.download_folder(root, 'out')
+    assert os.listdir(JOBS_DIR) == []
+    # the replay finished a.bin, the fresh listing found new.bin, Notes is refused for good
+    assert sorted(name for name in os.listdir('out') if not name.startswith('.')) == ['a.bin', 'new.bin']
+
+def test_mirror_crawls_folder_moved_into_root(drive, bulker):
+    root = drive.add_folder('Mirror')
+    drive.add_file('a.txt', root, content=b'a' * 100)
+    outside = drive.add_folder('Outside')
+    sub = drive.add_folder('Sub', outside)
+    drive.add_file('b.txt', outside, content=b'b' * 50)
+    drive.add_file('c.txt', sub, content=b'c' * 70)
+
+    mirror = DriveMirror(bulker, root, 'mirror')
+    mirror.sync()
+    assert sorted(os.listdir('mirror')) == ['.gdrive_manifest.sqlite', 'a.txt']
+
+    requests.patch(f'{drive.url}/drive/v3/files/{outside}', params={'addParents': root, 'removeParents': 'root'},
+                   json={}).raise_for_status()
+    mirror.sync()
+    with open('mirror/Outside/b.txt', 'rb') as moved:
+        assert moved.read() == b'b' * 50
+    with open('mirror/Outside/Sub/c.txt', 'rb') as moved:
+        assert moved.read() == b'c' * 70
+
+    # the crawl finished, so the token moved on and the move is not crawled again
+    drive.reset_stats()
+    mirror.sync()
+    assert 'GET /drive/v3/files' not in drive.stats
+
+def test_retried_batch_post_does_not_duplicate(drive, monkeypatch):
+    parent = drive.add_folder('Uploads')
+    send = Drive_Batch.DriveBatch._send
+    sent = []
+    def lossy_send(self, calls):
+        send(self, calls)
+        if not sent:
+            # the folders were created, but every other answer got lost on the way back
+            for call in calls[::2]:
+                call.status, call.result = 503, None
+        sent.append(len(calls))
+    monkeypatch.setattr(Drive_Batch.DriveBatch, '_send', lossy_send)
+
+    uploader = GdriveUploader('test-token')
+    folder_ids = uploader.batch_create_folders([(f'd{i}', parent) for i in range(5)])
+    assert sent == [5]
+    children = drive.children(parent)
+    assert sorted(child.name for child in children) == ['d0', 'd1', 'd2', 'd3', 'd4']
+    assert sorted(folder_ids) == sorted(child.id for child in children)